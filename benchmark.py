@@ -0,0 +1,341 @@
+"""OCR throughput benchmark.
+
+Generates a deterministic corpus of scanned-looking PDFs, runs it through the
+app end to end (upload, queue, page pool, merge, download) and prints the
+results as JSON so runs can be compared:
+
+    python benchmark.py --documents 8 --pages 10 --dpi 200 --output before.json
+    python benchmark.py --documents 8 --pages 10 --dpi 200 --baseline before.json
+
+The same seed and settings always produce byte-identical PDFs.
+"""
+import argparse
+import concurrent.futures
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+logger = logging.getLogger('benchmark')
+
+WORDS = (
+    'the of and to in is that for it as was with be by on not he this are or his from at which but have an they '
+    'you were her she there been one all we their has would when what if more no out so said can who about them '
+    'into some could time these two may then do first any my now such like our over man me even most made after '
+    'also did many before must through back years where much your way well down should because each just those '
+    'invoice account payment total amount balance statement customer service report contract section agreement'
+).split()
+
+
+def draw_text(pdf, rng, width, height, top=72, bottom=72):
+    """Fill a page area with a heading and paragraphs of deterministic words"""
+    y = height - top
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawString(72, y, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 6))).title())
+    y -= 32
+    pdf.setFont('Helvetica', 11)
+    while y > bottom:
+        for _ in range(rng.randint(3, 8)):
+            if y <= bottom:
+                break
+            line = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 14)))
+            pdf.drawString(72, y, line[:95])
+            y -= 15
+        y -= 10
+
+
+def scan(rng, dpi, noise, rotation, size=letter):
+    """Render a text page to a grayscale image that looks like it came off a scanner"""
+    import fitz
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=size, invariant=1)
+    draw_text(pdf, rng, *size)
+    pdf.showPage()
+    pdf.save()
+
+    with fitz.open(stream=buffer.getvalue(), filetype='pdf') as doc:
+        pix = doc[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes('L', (pix.width, pix.height), pix.samples)
+
+    if rotation:
+        image = image.rotate(rng.uniform(-rotation, rotation), resample=Image.BILINEAR, fillcolor=255)
+
+    if noise:
+        # Salt-and-pepper speckle from the seeded generator, so it's reproducible
+        speckle = Image.frombytes('L', image.size, rng.randbytes(image.width * image.height))
+        threshold = int(noise * 128)
+        image.paste(0, mask=speckle.point(lambda v: 255 if v < threshold else 0))
+        image.paste(255, mask=speckle.point(lambda v: 255 if v > 255 - threshold else 0))
+    return image
+
+
+def generate_document(path, seed, dpi, noise, rotation, page_types):
+    """Write one PDF with a page of each type in page_types ('scan', 'text' or 'mixed')"""
+    width, height = letter
+    pdf = canvas.Canvas(path, pagesize=letter, invariant=1)
+    for page_num, page_type in enumerate(page_types):
+        rng = random.Random(f"{seed}:{os.path.basename(path)}:{page_num}")
+        if page_type == 'scan':
+            image = scan(rng, dpi, noise, rotation)
+            pdf.drawImage(ImageReader(image), 0, 0, width, height)
+        elif page_type == 'text':
+            draw_text(pdf, rng, width, height)
+        else:
+            # Text at the top, a scanned figure covering the lower half
+            draw_text(pdf, rng, width, height, bottom=height / 2 + 36)
+            figure = scan(rng, dpi, noise, rotation, size=(width, height / 2))
+            pdf.drawImage(ImageReader(figure), 0, 0, width, height / 2)
+        pdf.showPage()
+    pdf.save()
+
+
+def generate_corpus(directory, documents, pages, dpi, noise=0.0, rotation=0.0, text_ratio=0.0, mixed_ratio=0.0,
+                    seed=0):
+    """Generate a corpus of PDFs in directory and return their paths.
+
+    text_ratio and mixed_ratio are the share of pages with a text layer and
+    of pages mixing text with a scanned figure; the rest are plain scans.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    paths = []
+    for doc_num in range(documents):
+        path = os.path.join(directory, f"doc_{doc_num:04d}.pdf")
+        rng = random.Random(f"{seed}:{doc_num}")
+        page_types = []
+        for _ in range(pages):
+            draw = rng.random()
+            page_types.append('text' if draw < text_ratio else 'mixed' if draw < text_ratio + mixed_ratio else 'scan')
+        generate_document(path, seed, dpi, noise, rotation, page_types)
+        paths.append(path)
+    logger.info(f"📄 Generated {documents} documents x {pages} pages in {directory}")
+    return paths
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+class PeakSampler:
+    """Background thread tracking peak memory of the app's processes and peak working-file bytes"""
+
+    def __init__(self, main, interval=0.2):
+        self.main = main
+        self.interval = interval
+        self.peak_server_rss = 0
+        self.peak_pool_rss = 0
+        self.peak_total_rss = 0
+        self.peak_disk_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='peak-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        server = self.main.resident_memory_bytes() or 0
+        pool = self.main.page_pool_memory_bytes()
+        self.peak_server_rss = max(self.peak_server_rss, server)
+        self.peak_pool_rss = max(self.peak_pool_rss, pool)
+        self.peak_total_rss = max(self.peak_total_rss, server + pool)
+        self.peak_disk_bytes = max(self.peak_disk_bytes, self.main.directory_bytes(self.main.WORK_DIR))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def convert(client, path, options):
+    """Upload one document, wait for it and download the result. Returns a result record."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    started = time.time()
+    while True:
+        response = client.post('/start-conversion', data=dict(options, file=(io.BytesIO(data), os.path.basename(path))))
+        if response.status_code != 503:
+            break
+        time.sleep(float(response.headers.get('Retry-After', 1)))
+    if response.status_code != 200:
+        return {'document': path, 'status': 'rejected', 'error': response.get_json().get('error')}
+
+    job_id = response.get_json()['job_id']
+    while True:
+        status = client.get(f'/job-status/{job_id}').get_json()
+        if status['status'] not in ('queued', 'processing'):
+            break
+        time.sleep(0.05)
+    latency = time.time() - started
+
+    output_bytes = 0
+    if status['status'] == 'completed':
+        output_bytes = len(client.get(f'/download/{job_id}').data)
+    return {
+        'document': path,
+        'status': status['status'],
+        'error': status.get('error'),
+        'latency_seconds': latency,
+        'processing_seconds': status.get('processing_time'),
+        'pages': status.get('pages_processed') or 0,
+        'output_bytes': output_bytes
+    }
+
+
+def run_benchmark(paths, concurrency, options):
+    """Convert every document through the app and summarise throughput, latency, memory and disk"""
+    import main
+
+    client = main.app.test_client()
+    with PeakSampler(main) as sampler:
+        started = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            records = list(executor.map(lambda path: convert(client, path, options), paths))
+        wall_seconds = time.time() - started
+
+    completed = [record for record in records if record['status'] == 'completed']
+    latencies = [record['latency_seconds'] for record in completed]
+    pages = sum(record['pages'] for record in completed)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    return {
+        'documents_completed': len(completed),
+        'documents_failed': len(records) - len(completed),
+        'errors': sorted({record['error'] for record in records if record.get('error')}),
+        'pages': pages,
+        'wall_seconds': round(wall_seconds, 3),
+        'pages_per_second': round(pages / wall_seconds, 3) if wall_seconds else None,
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'max': max(latencies) if latencies else None,
+            'mean': sum(latencies) / len(latencies) if latencies else None
+        },
+        'peak_rss_bytes': {
+            'server': sampler.peak_server_rss,
+            'page_pool': sampler.peak_pool_rss,
+            'total': sampler.peak_total_rss,
+            # Kernel high-water marks catch spikes between samples
+            'server_maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'largest_child_maxrss': children.ru_maxrss * 1024
+        },
+        'peak_temp_disk_bytes': sampler.peak_disk_bytes,
+        'output_bytes': sum(record['output_bytes'] for record in completed)
+    }
+
+
+def environment():
+    import main
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ocr_engine': main.engine_version(),
+        'job_workers': main.JOB_WORKERS,
+        'page_processes': main.OCR_PAGE_PROCESSES,
+        'stream_pages': main.OCR_STREAM_PAGES
+    }
+
+
+def compare(results, baseline):
+    """Ratios of this run's headline numbers to a baseline run's (>1 means higher now)"""
+    def ratio(current, previous):
+        if current is None or not previous:
+            return None
+        return round(current / previous, 3)
+
+    old = baseline['results']
+    return {
+        'pages_per_second': ratio(results['pages_per_second'], old['pages_per_second']),
+        'latency_p50': ratio(results['latency_seconds']['p50'], old['latency_seconds']['p50']),
+        'latency_p95': ratio(results['latency_seconds']['p95'], old['latency_seconds']['p95']),
+        'peak_rss_total': ratio(results['peak_rss_bytes']['total'], old['peak_rss_bytes']['total']),
+        'peak_temp_disk': ratio(results['peak_temp_disk_bytes'], old['peak_temp_disk_bytes'])
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=4, help='documents in the corpus')
+    parser.add_argument('--pages', type=int, default=5, help='pages per document')
+    parser.add_argument('--dpi', type=int, default=200, help='resolution of the simulated scans')
+    parser.add_argument('--noise', type=float, default=0.02, help='share of pixels turned into speckle (0-1)')
+    parser.add_argument('--rotation', type=float, default=1.0, help='maximum skew of scanned pages, in degrees')
+    parser.add_argument('--text-ratio', type=float, default=0.0, help='share of pages with a text layer')
+    parser.add_argument('--mixed-ratio', type=float, default=0.0, help='share of pages mixing text and a scan')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=4, help='uploads in flight at once')
+    parser.add_argument('--language', default='eng')
+    parser.add_argument('--force-ocr', action='store_true')
+    parser.add_argument('--corpus', help='directory for the corpus (default: a temporary one)')
+    parser.add_argument('--generate-only', action='store_true', help='write the corpus to --corpus and exit')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    corpus = args.corpus or tempfile.mkdtemp(prefix='ocr-bench-corpus-')
+    paths = generate_corpus(corpus, args.documents, args.pages, args.dpi, args.noise, args.rotation,
+                            args.text_ratio, args.mixed_ratio, args.seed)
+    if args.generate_only:
+        return
+
+    # A fresh working directory, so caches start cold and disk use is the run's own
+    work_dir = tempfile.mkdtemp(prefix='ocr-bench-work-')
+    os.environ['OCR_WORK_DIR'] = work_dir
+    try:
+        options = {'language': args.language, 'force_ocr': '1' if args.force_ocr else ''}
+        report = {
+            'benchmark': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'corpus_bytes': sum(os.path.getsize(path) for path in paths),
+            'environment': environment(),
+            'results': run_benchmark(paths, args.concurrency, options)
+        }
+        if args.baseline:
+            with open(args.baseline) as f:
+                report['comparison'] = compare(report['results'], json.load(f))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.corpus:
+            shutil.rmtree(corpus, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        logger.info(f"📊 Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Stand-in for the tesseract CLI, for load tests that shouldn't spend time on real OCR.
+
+Accepts the same command lines the app uses:
+
+    tesseract <image|stdin> <outputbase|stdout> [-l LANG] [--dpi N] [pdf] [txt]
+
+and answers with a canned single-page PDF (sized to the input image, with an
+invisible text layer) after a configurable delay:
+
+    FAKE_TESSERACT_LATENCY    seconds per page, fixed ("0.2") or a random range ("0.1-0.5")
+    FAKE_TESSERACT_FAIL_RATE  share of pages that fail with exit status 1 (default 0)
+
+Like the real binary it can't read PDFs.
+Only the standard library is used.
+"""
+import os
+import random
+import struct
+import sys
+import time
+
+VERSION = 'tesseract 5.3.0 (fake)'
+DEFAULT_DPI = 70  # what tesseract assumes for images without a resolution
+CANNED_TEXT = 'The quick brown fox jumps over the lazy dog'
+
+
+def parse_latency(value):
+    """'0.2' -> (0.2, 0.2), '0.1-0.5' -> (0.1, 0.5)"""
+    low, _, high = value.partition('-')
+    return float(low), float(high or low)
+
+
+def png_geometry(data):
+    """Width, height and DPI (if recorded) of a PNG image"""
+    if not data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return None, None, None
+    width, height = struct.unpack('>II', data[16:24])
+    dpi = None
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        if kind == b'pHYs':
+            x_per_metre, _, unit = struct.unpack('>IIB', data[pos + 8:pos + 17])
+            if unit == 1:
+                dpi = round(x_per_metre * 0.0254)
+            break
+        if kind == b'IDAT':
+            break
+        pos += 12 + length
+    return width, height, dpi
+
+
+def canned_pdf(width_pt, height_pt, text=CANNED_TEXT):
+    """A minimal valid one-page PDF with invisible (render mode 3) text, like tesseract's output"""
+    content = f"BT 3 Tr /F1 12 Tf 36 {height_pt / 2:.2f} Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] "
+         f"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>").encode(),
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.5\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def parse_args(argv):
+    """Split a tesseract command line into (image, outputbase, options, configs)"""
+    positional, options, configs = [], {}, []
+    args = iter(argv)
+    for arg in args:
+        if arg in ('-l', '--dpi', '--psm', '--oem', '-c', '--tessdata-dir'):
+            options[arg] = next(args, None)
+        elif arg.startswith('-'):
+            options[arg] = True
+        elif len(positional) < 2:
+            positional.append(arg)
+        else:
+            configs.append(arg)
+    return positional, options, configs
+
+
+def main(argv):
+    if '--version' in argv or '-v' in argv:
+        print(VERSION)
+        return 0
+    if '--list-langs' in argv:
+        print('List of available languages (1):\neng')
+        return 0
+
+    positional, options, configs = parse_args(argv)
+    if len(positional) < 2:
+        print('Usage: tesseract imagename outputbase [options...] [configfile...]', file=sys.stderr)
+        return 1
+    image, outputbase = positional
+
+    if image == 'stdin':
+        data = sys.stdin.buffer.read()
+    else:
+        try:
+            with open(image, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f'Error, cannot read input file {image}: {e}', file=sys.stderr)
+            return 1
+
+    if data.startswith(b'%PDF'):
+        print('Error in pixReadStream: Unknown format: no pix returned', file=sys.stderr)
+        print(f'Error during processing of {image}', file=sys.stderr)
+        return 1
+
+    low, high = parse_latency(os.environ.get('FAKE_TESSERACT_LATENCY', '0.2'))
+    time.sleep(random.uniform(low, high))
+    if random.random() < float(os.environ.get('FAKE_TESSERACT_FAIL_RATE', 0)):
+        print('Error: simulated recognition failure', file=sys.stderr)
+        return 1
+
+    width, height, png_dpi = png_geometry(data)
+    dpi = int(options.get('--dpi') or png_dpi or DEFAULT_DPI)
+    if width and height:
+        size = (width * 72 / dpi, height * 72 / dpi)
+    else:
+        size = (612, 792)
+
+    outputs = []
+    if 'pdf' in configs or not configs:
+        outputs.append(('.pdf', canned_pdf(*size)))
+    if 'txt' in configs:
+        outputs.append(('.txt', (CANNED_TEXT + '\n').encode()))
+
+    for suffix, payload in outputs:
+        if outputbase == 'stdout':
+            sys.stdout.buffer.write(payload)
+        else:
+            with open(outputbase + suffix, 'wb') as f:
+                f.write(payload)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,349 @@
+"""HTTP load test for the Flask layer.
+
+Starts the app in a separate process, with fake_tesseract.py standing in for
+the tesseract binary, and runs a number of simulated users against it. Each
+user uploads a PDF, polls its status and downloads the result, over and over.
+Nothing leaves the machine:
+
+    python loadtest.py --concurrency 10,50,200 --duration 30 --ocr-latency 0.05-0.3
+
+For every concurrency level it prints, as JSON:
+
+- request latency percentiles per endpoint
+- error rates and rejected uploads (503 from a full queue)
+- the server process's peak threads, file descriptors and memory
+- the same figures again once the level has drained, to spot leaks
+"""
+import argparse
+import collections
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmark import generate_corpus, percentile
+
+logger = logging.getLogger('loadtest')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ('start_conversion', 'get_job_status', 'download_result')
+
+
+def serve(port):
+    """Run the app on localhost with a thread per request (called in the server process)"""
+    from werkzeug.serving import make_server
+
+    import main
+
+    make_server('127.0.0.1', port, main.app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def install_fake_tesseract(directory):
+    """Put a 'tesseract' on a private PATH entry that runs fake_tesseract.py"""
+    shim = os.path.join(directory, 'tesseract')
+    with open(shim, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "fake_tesseract.py")}" "$@"\n')
+    os.chmod(shim, 0o755)
+
+
+class Server:
+    """The app under test, in its own process group so its page pool goes down with it"""
+
+    def __init__(self, args, scratch_dir):
+        self.port = free_port()
+        bin_dir = os.path.join(scratch_dir, 'bin')
+        os.makedirs(bin_dir)
+        install_fake_tesseract(bin_dir)
+
+        env = dict(
+            os.environ,
+            PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+            OCR_ENGINE='subprocess',
+            OCR_WORK_DIR=os.path.join(scratch_dir, 'work'),
+            FAKE_TESSERACT_LATENCY=args.ocr_latency,
+            FAKE_TESSERACT_FAIL_RATE=str(args.ocr_fail_rate)
+        )
+        if not args.with_caches:
+            # Every upload is identical apart from a nonce; caches would skip the work being measured
+            env.update(OCR_PAGE_CACHE_MB='0', OCR_RESULT_CACHE_MB='0')
+        if args.workers:
+            env['OCR_JOB_WORKERS'] = str(args.workers)
+        if args.queue_size:
+            env['OCR_QUEUE_SIZE'] = str(args.queue_size)
+
+        log = open(args.server_log, 'ab') if args.server_log else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', str(self.port)],
+            env=env, cwd=HERE, stdout=log, stderr=log, start_new_session=True
+        )
+        self.pid = self.process.pid
+
+    def wait_ready(self, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {self.process.returncode}')
+            try:
+                status, _, _ = request(self.port, 'GET', '/test')
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError('Server did not start in time')
+
+    def stop(self):
+        try:
+            os.killpg(self.pid, signal.SIGTERM)
+            self.process.wait(timeout=10)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            os.killpg(self.pid, signal.SIGKILL)
+
+    def resources(self):
+        """Threads, open file descriptors and resident memory of the server process"""
+        proc = f'/proc/{self.pid}'
+        try:
+            with open(f'{proc}/statm') as f:
+                rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+            return {
+                'threads': len(os.listdir(f'{proc}/task')),
+                'fds': len(os.listdir(f'{proc}/fd')),
+                'rss_bytes': rss
+            }
+        except (OSError, ValueError):
+            return None
+
+
+def request(port, method, path, body=None, headers=None, timeout=120):
+    """One HTTP request on a fresh connection. Returns (status, headers, body)."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def multipart(fields, filename, data):
+    """Encode form fields plus one file as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                  f'Content-Type: application/pdf\r\n\r\n').encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Stats:
+    """Latencies and outcomes per endpoint, shared by all simulated users"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.rejected = 0
+        self.jobs = collections.Counter()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def count_job(self, status):
+        with self._lock:
+            self.jobs[status] += 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+
+def timed(stats, endpoint, port, method, path, ok_statuses=(200,), **kwargs):
+    started = time.perf_counter()
+    try:
+        status, headers, body = request(port, method, path, **kwargs)
+    except OSError:
+        stats.record(endpoint, time.perf_counter() - started, False)
+        return None, {}, b''
+    stats.record(endpoint, time.perf_counter() - started, status in ok_statuses)
+    return status, headers, body
+
+
+def simulated_user(port, pdf, stop, stats, poll_interval):
+    """Upload, poll until done, download; repeat until stopped"""
+    while not stop.is_set():
+        # A nonce after %%EOF makes each upload distinct without changing the document
+        data = pdf + f'\n% {uuid.uuid4().hex}\n'.encode()
+        body, content_type = multipart({'language': 'eng'}, 'load.pdf', data)
+        status, headers, response = timed(stats, 'start_conversion', port, 'POST', '/start-conversion',
+                                          ok_statuses=(200, 503), body=body,
+                                          headers={'Content-Type': content_type})
+        if status == 503:
+            stats.reject()
+            stop.wait(float(headers.get('Retry-After', 1)) * random.uniform(0.5, 1.5))
+            continue
+        if status != 200:
+            stop.wait(1)
+            continue
+        job_id = json.loads(response)['job_id']
+
+        job_status = None
+        while not stop.is_set():
+            status, _, response = timed(stats, 'get_job_status', port, 'GET', f'/job-status/{job_id}')
+            if status == 200:
+                job_status = json.loads(response)['status']
+                if job_status not in ('queued', 'processing'):
+                    break
+            stop.wait(poll_interval)
+        if job_status is None or job_status in ('queued', 'processing'):
+            return  # stopped while waiting
+
+        stats.count_job(job_status)
+        if job_status == 'completed':
+            timed(stats, 'download_result', port, 'GET', f'/download/{job_id}')
+
+
+def summarize(latencies, errors):
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / len(latencies), 4) if latencies else None,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies) if latencies else None
+    }
+
+
+def run_level(server, pdf, concurrency, duration, poll_interval, settle):
+    """Hold `concurrency` users against the server for `duration` seconds"""
+    stats = Stats()
+    stop = threading.Event()
+    peaks = {'threads': 0, 'fds': 0, 'rss_bytes': 0}
+
+    users = [threading.Thread(target=simulated_user, args=(server.port, pdf, stop, stats, poll_interval),
+                              name=f'user-{i}', daemon=True)
+             for i in range(concurrency)]
+    started = time.time()
+    for user in users:
+        user.start()
+
+    while time.time() - started < duration:
+        sample = server.resources() or {}
+        for key in peaks:
+            peaks[key] = max(peaks[key], sample.get(key, 0))
+        time.sleep(0.25)
+
+    stop.set()
+    for user in users:
+        user.join()
+    elapsed = time.time() - started
+
+    # Let in-flight work drain so leftover threads or descriptors stand out
+    time.sleep(settle)
+    after = server.resources() or {}
+
+    requests = sum(len(values) for values in stats.latencies.values())
+    errors = sum(stats.errors.values())
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'requests': requests,
+        'requests_per_second': round(requests / elapsed, 2),
+        'errors': errors,
+        'error_rate': round(errors / requests, 4) if requests else None,
+        'rejected_uploads': stats.rejected,
+        'jobs': dict(stats.jobs),
+        'endpoints': {endpoint: summarize(stats.latencies[endpoint], stats.errors[endpoint])
+                      for endpoint in ENDPOINTS},
+        'server': {
+            'peak_threads': peaks['threads'],
+            'peak_fds': peaks['fds'],
+            'peak_rss_bytes': peaks['rss_bytes'],
+            'threads_after': after.get('threads'),
+            'fds_after': after.get('fds')
+        }
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--concurrency', default='10,50,100', help='comma-separated numbers of simulated users')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to hold each concurrency level')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between status polls')
+    parser.add_argument('--settle', type=float, default=3, help='seconds to wait after each level before sampling')
+    parser.add_argument('--pages', type=int, default=1, help='pages in the uploaded PDF')
+    parser.add_argument('--ocr-latency', default='0.2', help='fake OCR seconds per page, fixed or "min-max"')
+    parser.add_argument('--ocr-fail-rate', type=float, default=0.0, help='share of pages the fake engine fails')
+    parser.add_argument('--workers', type=int, help='OCR_JOB_WORKERS for the server')
+    parser.add_argument('--queue-size', type=int, help='OCR_QUEUE_SIZE for the server')
+    parser.add_argument('--with-caches', action='store_true', help='keep the page and result caches enabled')
+    parser.add_argument('--server-log', help='append the server\'s output to this file')
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--serve', type=int, metavar='PORT', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        serve(args.serve)
+        return
+    logging.basicConfig(level=logging.INFO)
+
+    scratch_dir = tempfile.mkdtemp(prefix='ocr-loadtest-')
+    server = None
+    try:
+        corpus = generate_corpus(os.path.join(scratch_dir, 'corpus'), 1, args.pages, dpi=100, seed=0)
+        with open(corpus[0], 'rb') as f:
+            pdf = f.read()
+
+        server = Server(args, scratch_dir)
+        server.wait_ready()
+        logger.info(f"🚀 Server running on port {server.port} (pid {server.pid})")
+
+        levels = []
+        for concurrency in (int(level) for level in args.concurrency.split(',')):
+            logger.info(f"📈 {concurrency} users for {args.duration:g}s...")
+            levels.append(run_level(server, pdf, concurrency, args.duration, args.poll_interval, args.settle))
+
+        report = {
+            'settings': {key: value for key, value in vars(args).items() if key not in ('serve', 'output')},
+            'levels': levels
+        }
+    finally:
+        if server is not None:
+            server.stop()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        logger.info(f"📊 Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
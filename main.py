@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, Request, request, jsonify, send_file, render_template_string
 import tempfile
 import os
 import logging
@@ -7,16 +7,222 @@ import threading
 import uuid
 import json
 import time
+import math
+import collections
+import concurrent.futures
+import multiprocessing
+import hashlib
+import re
+import shutil
+import io
+import socket
+import sqlite3
+import contextlib
+import fcntl
+import resource
+import zipfile
+import werkzeug.datastructures
+import werkzeug.exceptions
+import werkzeug.utils
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max per request (single upload or chunk)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory storage for job status (in production, use Redis or database)
-jobs = {}
+# Job updates bump a version counter and wake anyone streaming job events
+job_updates = threading.Condition()
+job_updates_version = 0
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 300  # browsers reconnect automatically after this
+
+# Job scheduling: a fixed pool of workers sized from the CPU count, fed by a
+# bounded queue. Uploads beyond the queue capacity are turned away. Queued jobs
+# start highest priority first, then small jobs (at most OCR_SMALL_JOB_PAGES
+# pages, fewest first), then in arrival order; one extra worker only takes
+# small jobs, so they never wait for a big one to finish.
+JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', os.cpu_count() or 1))
+JOB_QUEUE_SIZE = int(os.environ.get('OCR_QUEUE_SIZE', JOB_WORKERS * 4))
+DEFAULT_JOB_SECONDS = 30  # ETA guess until real job timings are available
+SMALL_JOB_PAGES = int(os.environ.get('OCR_SMALL_JOB_PAGES', 10))
+
+# Uploads can ask for priority=low|normal|high. Running jobs share the page
+# pool in proportion to these weights, so a high priority job gets four pages
+# through for every page of a normal one. Low priority jobs never count as small.
+PRIORITY_WEIGHTS = {'low': 1, 'normal': 4, 'high': 16}
+DEFAULT_PRIORITY = 'normal'
+
+# Page-level parallelism: pages are rendered and OCR'd in a shared pool of
+# processes so a single large document can use every core.
+OCR_PAGE_PROCESSES = int(os.environ.get('OCR_PAGE_PROCESSES', os.cpu_count() or 1))
+OPEN_DOCUMENTS_PER_PROCESS = 4
+PAGE_SLOTS = OCR_PAGE_PROCESSES + 1  # pages handed to the pool at once; the rest wait their turn
+
+# Memory budget: a job feeds the pool a sliding window of pages, sized so
+# their estimated memory (rendered pixels, the PNG, the engine's working set and
+# the finished page waiting to be merged) stays within OCR_JOB_MEMORY_MB, and
+# all jobs in this process together within OCR_MEMORY_BUDGET_MB (default: half
+# the machine's memory). Merged pages are written out to disk every
+# OCR_MERGE_WINDOW_PAGES pages, so memory doesn't grow with the page count.
+JOB_MEMORY_BUDGET_BYTES = int(os.environ.get('OCR_JOB_MEMORY_MB', 1024)) * 1024 * 1024
+MEMORY_BUDGET_BYTES = int(os.environ.get('OCR_MEMORY_BUDGET_MB', 0)) * 1024 * 1024 or (
+    os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2)
+MERGE_WINDOW_PAGES = int(os.environ.get('OCR_MERGE_WINDOW_PAGES', 100))
+PAGE_MEMORY_BYTES_PER_PIXEL = 12
+
+# Each tesseract process runs single-threaded; parallelism comes from the pool
+TESSERACT_ENV = dict(os.environ, OMP_THREAD_LIMIT='1')
+
+# Stream rendered pages to tesseract over stdin/stdout and merge the page PDFs
+# from memory, instead of round-tripping PNGs and PDFs through a temp dir
+OCR_STREAM_PAGES = os.environ.get('OCR_STREAM_PAGES', '1') == '1'
+
+# OCR engine: 'tesserocr' keeps a pre-initialised tesseract API per language in
+# every pool process, 'subprocess' runs the tesseract CLI per page, and 'auto'
+# uses tesserocr when it is installed. tesserocr isn't in requirements.txt (it
+# builds against the system tesseract), so by default pages go through the CLI.
+# Warm engines are recycled after this many pages to cap their memory.
+OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+ENGINE_RECYCLE_PAGES = int(os.environ.get('OCR_ENGINE_RECYCLE_PAGES', 500))
+
+# OCR settings that affect the output (and therefore the cache key)
+OCR_LANGUAGE = os.environ.get('OCR_LANGUAGE', 'eng')
+
+# Output optimisation while merging: every page PDF from tesseract embeds its
+# own copy of the same font, so identical fonts and other small resources are
+# shared between pages. Images on OCR'd pages can also be re-encoded as JPEG
+# (OCR_JPEG_QUALITY, or per upload; 0 keeps them as they are), and the result
+# is linearised for fast web viewing.
+OCR_JPEG_QUALITY = int(os.environ.get('OCR_JPEG_QUALITY', 0))
+OCR_LINEARIZE = os.environ.get('OCR_LINEARIZE', '1') == '1'
+SHARED_RESOURCE_TYPES = ('/Font', '/ExtGState', '/ColorSpace')
+
+# Pages are rendered at OCR_TARGET_DPI, but never at more than twice the
+# resolution of the scan on them (upsampling further adds nothing), and scaled
+# down when the pixmap would exceed OCR_MAX_PAGE_PIXELS. Only an image covering
+# at least SCAN_PAGE_COVERAGE of the page counts as a scan; a small logo says
+# nothing about the resolution the rest of the page needs.
+OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+OCR_MIN_DPI = 72
+SCAN_PAGE_COVERAGE = 0.8
+OCR_MAX_PAGE_PIXELS = int(os.environ.get('OCR_MAX_PAGE_MEGAPIXELS', 16)) * 1000 * 1000
+
+# Pages with at least this much extractable text, and images covering no more
+# than this fraction of the page, already have a usable text layer
+MIN_TEXT_CHARS = 50
+MAX_TEXT_PAGE_IMAGE_COVERAGE = 0.25
+
+# Routing: each input type has one way to be processed (see choose_strategy).
+# Time estimates use the measured time per page in this process, or this guess
+# until then.
+DEFAULT_PAGE_SECONDS = 2.0
+MERGE_PAGE_SECONDS = 0.01
+INPUT_SIGNATURES = [
+    (b'%PDF', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+]
+LANGUAGE_PATTERN = re.compile(r'^[a-z_]{3,}(\+[a-z_]{3,})*$')
+
+# Working directory for caches and other files that outlive a single request
+WORK_DIR = os.environ.get('OCR_WORK_DIR', os.path.join(tempfile.gettempdir(), 'ocr-frontend'))
+RESULT_CACHE_DIR = os.path.join(WORK_DIR, 'cache', 'results')
+RESULT_CACHE_BYTES = int(os.environ.get('OCR_RESULT_CACHE_MB', 1024)) * 1024 * 1024
+PAGE_CACHE_DIR = os.path.join(WORK_DIR, 'cache', 'pages')
+PAGE_CACHE_BYTES = int(os.environ.get('OCR_PAGE_CACHE_MB', 512)) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Chunked uploads stream to disk in pieces, so whole files can be far larger
+# than a single request. Idle unfinished uploads are discarded.
+UPLOAD_DIR = os.path.join(WORK_DIR, 'uploads')
+MAX_UPLOAD_BYTES = int(os.environ.get('OCR_MAX_UPLOAD_MB', 4096)) * 1024 * 1024
+CLIENT_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_IDLE_SECONDS = 24 * 3600
+
+# Job retention: finished jobs are forgotten (and their outputs deleted) after
+# a per-state TTL. None keeps jobs in that state forever. Outputs are also
+# evicted oldest-first when they exceed the disk quota or free space runs low.
+JOB_TTLS = {
+    'queued': None,
+    'processing': None,
+    'completed': int(os.environ.get('OCR_JOB_TTL_COMPLETED', 3600)),
+    'failed': int(os.environ.get('OCR_JOB_TTL_FAILED', 3600)),
+    'expired': int(os.environ.get('OCR_JOB_TTL_EXPIRED', 3600)),
+}
+OUTPUT_QUOTA_BYTES = int(os.environ.get('OCR_OUTPUT_QUOTA_MB', 2048)) * 1024 * 1024
+MIN_FREE_DISK_BYTES = int(os.environ.get('OCR_MIN_FREE_DISK_MB', 512)) * 1024 * 1024
+REAPER_INTERVAL_SECONDS = 60
+
+# Job state backend: 'memory' keeps jobs in this process; 'sqlite' keeps them
+# in a database under OCR_WORK_DIR so several worker processes (or nodes
+# sharing the directory) see the same jobs and claim queued work from it.
+OCR_JOB_STORE = os.environ.get('OCR_JOB_STORE', 'memory')
+JOB_DB_PATH = os.path.join(WORK_DIR, 'jobs.sqlite3')
+OUTPUT_DIR = os.path.join(WORK_DIR, 'outputs')
+STORE_POLL_SECONDS = 1.0  # how often idle workers and event streams re-check the store
+
+# Crash safety: every unfinished job has a directory under JOBS_DIR with its
+# metadata and the single-page PDFs finished so far. On startup, jobs whose
+# worker died are re-queued and resume from their first unfinished page.
+JOBS_DIR = os.path.join(WORK_DIR, 'jobs')
+OCR_CHECKPOINT_PAGES = os.environ.get('OCR_CHECKPOINT_PAGES', '1') == '1'
+
+OCR_RECOVER_JOBS = os.environ.get('OCR_RECOVER_JOBS', '1') == '1'
+PROCESS_TOKEN = uuid.uuid4().hex[:8]  # tells this process apart from an earlier one with the same pid
+
+# Partial results: while a job runs, its leading finished pages are kept in a
+# PDF that can be downloaded before the rest are done (refreshed at most every
+# OCR_PARTIAL_SECONDS, since each refresh rewrites the whole prefix)
+OCR_PARTIAL_RESULTS = os.environ.get('OCR_PARTIAL_RESULTS', '1') == '1'
+PARTIAL_RESULT_SECONDS = float(os.environ.get('OCR_PARTIAL_SECONDS', 5))
+
+# Downloads: by default the app sends finished files itself, answering Range and
+# If-None-Match requests (WSGI servers with a wsgi.file_wrapper, like gunicorn,
+# copy the bytes with os.sendfile). Behind a front-end server the transfer can
+# be handed off instead so no worker thread is tied up: 'x-sendfile' (Apache
+# mod_xsendfile, lighttpd) or 'x-accel' (nginx, with an internal location that
+# serves OCR_WORK_DIR under OCR_ACCEL_PREFIX).
+OCR_SENDFILE = os.environ.get('OCR_SENDFILE', '').lower()
+ACCEL_REDIRECT_PREFIX = os.environ.get('OCR_ACCEL_PREFIX', '/ocr-files/')
+
+# Batches: many PDFs (or ZIP archives of them) submitted in one request, or
+# first sent as chunked uploads and referenced by id. Each batch is a JSON file
+# listing its jobs, so any worker process can report on it. ZIP archives are
+# checked against the member count and unpacked size they declare before
+# anything is extracted.
+BATCH_DIR = os.path.join(WORK_DIR, 'batches')
+MAX_BATCH_FILES = int(os.environ.get('OCR_MAX_BATCH_FILES', 1000))
+MAX_BATCH_REQUEST_BYTES = int(os.environ.get('OCR_MAX_BATCH_MB', 1024)) * 1024 * 1024
+MAX_ZIP_MEMBERS = int(os.environ.get('OCR_MAX_ZIP_MEMBERS', 10000))
+MAX_BATCH_UNPACKED_BYTES = int(os.environ.get('OCR_MAX_BATCH_UNPACKED_MB', 16384)) * 1024 * 1024
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class OCRRequest(Request):
+    """Requests limited to MAX_CONTENT_LENGTH, except batch uploads, which get their own limit"""
+
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'start_batch':
+            return MAX_BATCH_REQUEST_BYTES
+        return super().max_content_length
+
+
+app.request_class = OCRRequest
+
+# Per-job traces: timed spans for every stage and page, downloadable from
+# /job-trace/<job_id> as Chrome trace-event JSON. Uploads can ask for one
+# with trace=1; OCR_TRACE_JOBS=1 traces every job.
+OCR_TRACE_JOBS = os.environ.get('OCR_TRACE_JOBS', '0') == '1'
+TRACE_DIR = os.path.join(WORK_DIR, 'traces')
+
+# Metrics served at /metrics in Prometheus text format. Each worker process
+# keeps its own, so scrape every process when running several.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
 
 # Simple HTML with polling-based processing
 HTML_TEMPLATE = '''
@@ -155,13 +361,32 @@ HTML_TEMPLATE = '''
 <body>
     <div class="container">
         <h1>📄 OCR PDF Converter</h1>
-        <p>Convert scanned PDFs to searchable documents - <strong>No more timeouts!</strong></p>
+        <p>Convert scanned PDFs and images to searchable documents - <strong>No more timeouts!</strong></p>
 
         <div class="upload">
-            <h3>📁 Select PDF File</h3>
-            <input type="file" id="fileInput" accept=".pdf" />
+            <h3>📁 Select PDF or Image File</h3>
+            <input type="file" id="fileInput" accept=".pdf,.jpg,.jpeg,.png,.tif,.tiff" />
             <br>
-            <button id="convertBtn" onclick="startConversion()" disabled>Choose a PDF file first</button>
+            <label for="languageSelect">🌍 Language:</label>
+            <select id="languageSelect">
+                <option value="eng">English</option>
+                <option value="spa">Spanish</option>
+                <option value="fra">French</option>
+                <option value="deu">German</option>
+                <option value="ita">Italian</option>
+                <option value="chi_sim">Chinese (Simplified)</option>
+            </select>
+            <label><input type="checkbox" id="forceOcr" /> Force OCR on pages that already have text</label>
+            <br>
+            <label for="jpegQuality">🗜️ Image compression:</label>
+            <select id="jpegQuality">
+                <option value="">Keep images as they are</option>
+                <option value="85">High quality (JPEG 85)</option>
+                <option value="60">Smaller file (JPEG 60)</option>
+                <option value="40">Smallest file (JPEG 40)</option>
+            </select>
+            <br><br>
+            <button id="convertBtn" onclick="startConversion()" disabled>Choose a PDF or image file first</button>
             <br><br>
             <small>💡 Now works with large files - no network timeouts!</small>
         </div>
@@ -190,8 +415,11 @@ HTML_TEMPLATE = '''
             console.log('✅ File input found');
         }
 
+        const MAX_UPLOAD_MB = {{ max_upload_mb }};
+
         let selectedFile = null;
         let pollInterval = null;
+        let eventSource = null;
 
         fileInput.addEventListener('change', function(e) {
             console.log('🔥 File selected!');
@@ -209,13 +437,13 @@ HTML_TEMPLATE = '''
                 type: file.type
             });
 
-            if (!file.name.toLowerCase().endsWith('.pdf')) {
-                updateStatus('<div class="error">❌ Please select a PDF file</div>');
+            if (!/\.(pdf|jpe?g|png|tiff?)$/i.test(file.name)) {
+                updateStatus('<div class="error">❌ Please select a PDF, JPG, PNG or TIFF file</div>');
                 return;
             }
 
-            if (file.size > 50 * 1024 * 1024) {
-                updateStatus('<div class="error">❌ File too large (max 50MB)</div>');
+            if (file.size > MAX_UPLOAD_MB * 1024 * 1024) {
+                updateStatus(`<div class="error">❌ File too large (max ${MAX_UPLOAD_MB}MB)</div>`);
                 return;
             }
 
@@ -228,7 +456,7 @@ HTML_TEMPLATE = '''
                     <strong>✅ Ready to Convert!</strong><br><br>
                     📄 <strong>File:</strong> ${file.name}<br>
                     📊 <strong>Size:</strong> ${(file.size/1024/1024).toFixed(2)} MB<br>
-                    ⚡ <strong>New:</strong> Uses polling to prevent timeouts!
+                    ⚡ <strong>New:</strong> Live progress pushed from the server!
                 </div>
             `);
 
@@ -250,19 +478,27 @@ HTML_TEMPLATE = '''
             convertBtn.textContent = '🔄 Starting...';
 
             try {
-                // Step 1: Start the job
-                const formData = new FormData();
-                formData.append('file', selectedFile);
+                // Step 1: Upload the file in resumable chunks
+                console.log('📤 Uploading file to server...');
 
-                console.log('📤 Submitting job to server...');
+                const uploadId = await uploadInChunks(selectedFile);
 
-                const startResponse = await fetch('/start-conversion', {
+                // Step 2: Start the job
+                const startResponse = await fetch(`/uploads/${uploadId}/finalize`, {
                     method: 'POST',
-                    body: formData
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        language: document.getElementById('languageSelect').value,
+                        force_ocr: document.getElementById('forceOcr').checked ? '1' : '',
+                        jpeg_quality: document.getElementById('jpegQuality').value
+                    })
                 });
 
                 if (!startResponse.ok) {
                     const errorData = await startResponse.json();
+                    if (startResponse.status === 503 && errorData.retry_after) {
+                        throw new Error(`${errorData.error} (try again in ${errorData.retry_after}s)`);
+                    }
                     throw new Error(errorData.error || 'Failed to start conversion');
                 }
 
@@ -271,7 +507,7 @@ HTML_TEMPLATE = '''
 
                 console.log('✅ Job started with ID:', jobId);
 
-                // Step 2: Poll for progress
+                // Step 3: Follow progress
                 updateStatus(`
                     <div class="progress" style="display: block;">
                         <h4>🚀 Job Started Successfully!</h4>
@@ -280,14 +516,15 @@ HTML_TEMPLATE = '''
                             <div class="progress-fill" id="progressFill"></div>
                         </div>
                         <p id="progressText">⏳ Initializing OCR processing...</p>
+                        <p id="partialResult"></p>
                         <small>✅ <strong>No timeouts:</strong> Using background processing with progress updates</small>
                     </div>
                 `);
 
                 convertBtn.textContent = '⏳ Processing...';
 
-                // Poll for updates
-                pollForProgress(jobId);
+                // Follow updates (pushed by the server, polling as a fallback)
+                followProgress(jobId);
 
             } catch (error) {
                 console.error('❌ Failed to start conversion:', error);
@@ -304,6 +541,108 @@ HTML_TEMPLATE = '''
             }
         }
 
+        async function uploadInChunks(file) {
+            const initResponse = await fetch('/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: file.name, size: file.size })
+            });
+            const initData = await initResponse.json();
+            if (!initResponse.ok) {
+                throw new Error(initData.error || 'Failed to start upload');
+            }
+
+            const uploadId = initData.upload_id;
+            const chunkSize = initData.chunk_size;
+            let offset = 0;
+            let failures = 0;
+
+            while (offset < file.size) {
+                convertBtn.textContent = `📤 Uploading ${Math.floor(offset / file.size * 100)}%...`;
+
+                try {
+                    const response = await fetch(`/uploads/${uploadId}?offset=${offset}`, {
+                        method: 'PUT',
+                        headers: { 'Content-Type': 'application/octet-stream' },
+                        body: file.slice(offset, offset + chunkSize)
+                    });
+                    const data = await response.json();
+
+                    if (response.ok || response.status === 409) {
+                        // 409 means the server has a different offset; continue from there
+                        offset = data.offset;
+                        failures = 0;
+                    } else {
+                        const error = new Error(data.error || 'Upload failed');
+                        error.fatal = true;
+                        throw error;
+                    }
+                } catch (error) {
+                    if (error.fatal || ++failures > 5) {
+                        throw error;
+                    }
+                    console.warn(`⚠️ Chunk upload failed (attempt ${failures}), resuming...`, error);
+                    await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+
+                    // Ask the server how much actually arrived before retrying
+                    try {
+                        const statusResponse = await fetch(`/uploads/${uploadId}`);
+                        if (statusResponse.ok) {
+                            offset = (await statusResponse.json()).offset;
+                        }
+                    } catch (statusError) {
+                        // Still offline; the next attempt will tell
+                    }
+                }
+            }
+
+            return uploadId;
+        }
+
+        function handleStatus(jobId, status) {
+            updateProgress(status);
+            updatePartialResult(jobId, status);
+
+            if (status.status === 'completed') {
+                showCompletion(jobId, status);
+                return true;
+            } else if (status.status === 'failed') {
+                showError(status.error || 'Processing failed');
+                return true;
+            }
+            return false;
+        }
+
+        function followProgress(jobId) {
+            if (!window.EventSource) {
+                pollForProgress(jobId);
+                return;
+            }
+
+            console.log('📡 Subscribing to job events:', jobId);
+
+            eventSource = new EventSource(`/job-events/${jobId}`);
+
+            eventSource.onmessage = (event) => {
+                const status = JSON.parse(event.data);
+                console.log('📊 Job event:', status);
+
+                if (handleStatus(jobId, status)) {
+                    eventSource.close();
+                    eventSource = null;
+                }
+            };
+
+            eventSource.onerror = () => {
+                // EventSource reconnects on its own; only fall back when it gives up
+                if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+                    console.warn('⚠️ Event stream closed, falling back to polling');
+                    eventSource = null;
+                    pollForProgress(jobId);
+                }
+            };
+        }
+
         function pollForProgress(jobId) {
             console.log('🔄 Starting to poll job:', jobId);
 
@@ -320,14 +659,8 @@ HTML_TEMPLATE = '''
                     const status = await response.json();
                     console.log('📊 Job status:', status);
 
-                    updateProgress(status);
-
-                    if (status.status === 'completed') {
-                        clearInterval(pollInterval);
-                        showCompletion(jobId, status);
-                    } else if (status.status === 'failed') {
+                    if (handleStatus(jobId, status)) {
                         clearInterval(pollInterval);
-                        showError(status.error || 'Processing failed');
                     }
 
                 } catch (error) {
@@ -343,7 +676,20 @@ HTML_TEMPLATE = '''
 
             if (progressFill && progressText) {
                 progressFill.style.width = status.progress + '%';
-                progressText.textContent = status.message || 'Processing...';
+                let text = status.message || 'Processing...';
+                if (status.eta_seconds) {
+                    text += ` (about ${status.eta_seconds}s remaining)`;
+                }
+                progressText.textContent = text;
+            }
+        }
+
+        function updatePartialResult(jobId, status) {
+            const partialResult = document.getElementById('partialResult');
+
+            if (partialResult && status.status === 'processing' && status.pages_ready > 0) {
+                partialResult.innerHTML = `<a href="/download/${jobId}?partial=1" target="_blank">` +
+                    `📄 Download the first ${status.pages_ready} of ${status.pages_total} pages now</a>`;
             }
         }
 
@@ -356,6 +702,8 @@ HTML_TEMPLATE = '''
                     <p><strong>${selectedFile.name}</strong> has been converted successfully!</p>
                     <p>📊 <strong>Processing time:</strong> ${Math.round(status.processing_time || 0)} seconds</p>
                     <p>📄 <strong>Pages processed:</strong> ${status.pages_processed || 'Unknown'}</p>
+                    ${status.output_size ? `<p>💾 <strong>File size:</strong> ${(status.output_size / 1048576).toFixed(1)} MB` +
+                        (status.estimated_bytes_saved > 0 ? ` (about ${(status.estimated_bytes_saved / 1048576).toFixed(1)} MB saved by optimisation)` : '') + '</p>' : ''}
                     <a href="/download/${jobId}" class="download-button">📥 Download OCR'd PDF</a>
                     <br><small>💡 Download will start when you click the button above</small>
                 </div>
@@ -377,7 +725,7 @@ HTML_TEMPLATE = '''
                 <div class="error">
                     <h4>❌ Conversion Failed</h4>
                     <p><strong>Error:</strong> ${errorMessage}</p>
-                    <p>Please try again or use a different PDF file.</p>
+                    <p>Please try again or use a different PDF or image file.</p>
                 </div>
             `);
 
@@ -401,297 +749,3371 @@ HTML_TEMPLATE = '''
             if (pollInterval) {
                 clearInterval(pollInterval);
             }
+            if (eventSource) {
+                eventSource.close();
+            }
         });
 
         // Initialize
-        updateStatus('<div style="color: #666;">👆 Select a PDF file above to get started</div>');
+        updateStatus('<div style="color: #666;">👆 Select a PDF, JPG, PNG or TIFF file above to get started</div>');
         console.log('✅ System ready');
     </script>
 </body>
 </html>
 '''
 
-def process_pdf_background(job_id, input_file, original_filename):
-    """Background processing function"""
+def link_or_copy(src, dest):
+    """Hard-link src to dest, copying when linking isn't possible (e.g. across filesystems)"""
     try:
-        jobs[job_id]['status'] = 'processing'
-        jobs[job_id]['message'] = 'Starting OCR processing...'
-        jobs[job_id]['progress'] = 10
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
 
-        logger.info(f"🚀 Background processing started for job {job_id}")
 
-        output_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        output_temp.close()
+class DiskCache:
+    """Size-capped directory of files addressed by key, evicting least recently used first"""
 
-        # Validate input
-        input_size = os.path.getsize(input_file)
-        logger.info(f"📊 Processing file: {original_filename} ({input_size} bytes)")
+    def __init__(self, directory, max_bytes, suffix='.pdf'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
 
-        if input_size == 0:
-            raise Exception("Input file is empty")
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
 
-        with open(input_file, 'rb') as f:
-            header = f.read(10)
-            if not header.startswith(b'%PDF'):
-                raise Exception("Invalid PDF file")
+    def get(self, key, dest):
+        """Place the cached file for key at dest. Returns False on a miss."""
+        path = self._path(key)
+        temp_path = f"{dest}.{uuid.uuid4().hex}.tmp"
+        try:
+            link_or_copy(path, temp_path)
+            os.replace(temp_path, dest)
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
 
-        jobs[job_id]['progress'] = 20
-        jobs[job_id]['message'] = 'Validating PDF file...'
+        with self._lock:
+            self.hits += 1
+        return True
 
-        # Try basic tesseract first
+    def put(self, key, src, evict=True):
+        """Store a copy of src under key, then trim the cache to size"""
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
         try:
-            logger.info("🔍 Trying basic tesseract...")
-            cmd = ['tesseract', input_file, output_temp.name.replace('.pdf', ''), 'pdf']
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-
-            expected_output = output_temp.name.replace('.pdf', '') + '.pdf'
-            if result.returncode == 0 and os.path.exists(expected_output):
-                if expected_output != output_temp.name:
-                    os.rename(expected_output, output_temp.name)
-                logger.info("✅ Basic tesseract succeeded!")
+            link_or_copy(src, temp_path)
+            os.utime(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not cache {key}: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        if evict:
+            self.evict()
+
+    def record(self, hit):
+        """Count a lookup made by another process sharing this cache directory"""
+        with self._lock:
+            if hit:
+                self.hits += 1
             else:
-                raise Exception("Basic tesseract failed")
+                self.misses += 1
+
+    def read(self, key):
+        """Return the cached bytes for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def write(self, key, data, evict=True):
+        """Store bytes under key, then trim the cache to size"""
+        path = self._path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not cache {key}: {e}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        if evict:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def stats(self):
+        entries = self._entries()
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes
+            }
 
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+os.makedirs(JOBS_DIR, exist_ok=True)
+os.makedirs(BATCH_DIR, exist_ok=True)
+os.makedirs(TRACE_DIR, exist_ok=True)
+
+result_cache = DiskCache(RESULT_CACHE_DIR, RESULT_CACHE_BYTES)
+page_cache = DiskCache(PAGE_CACHE_DIR, PAGE_CACHE_BYTES)
+
+
+def _metric_line(name, labels, value):
+    if labels:
+        pairs = ','.join('{}="{}"'.format(key, str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                         for key, val in labels.items())
+        name = f"{name}{{{pairs}}}"
+    return f"{name} {value if isinstance(value, int) else float(value)!r}"
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    """Distribution of durations in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum += value
+            self._count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield f"{self.name}_bucket", {'le': repr(float(bound))}, cumulative
+        yield f"{self.name}_bucket", {'le': '+Inf'}, count
+        yield f"{self.name}_sum", {}, total
+        yield f"{self.name}_count", {}, count
+
+    def mean(self, default=None):
+        with self._lock:
+            return self._sum / self._count if self._count else default
+
+
+class Gauge:
+    """Value read when metrics are scraped; read() returns a number or {label value: number}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, read, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+        self.label = label
+
+    def samples(self):
+        try:
+            value = self.read()
         except Exception as e:
-            logger.info(f"⚠️ Basic method failed: {e}")
+            logger.warning(f"⚠️ Could not read metric {self.name}: {e}")
+            return
+        if isinstance(value, dict):
+            for label_value, item in value.items():
+                if item is not None:
+                    yield self.name, {self.label: label_value}, item
+        elif value is not None:
+            yield self.name, {}, value
 
-            # Use PyMuPDF method
-            jobs[job_id]['progress'] = 30
-            jobs[job_id]['message'] = 'Using advanced OCR method...'
 
-            import fitz
-            import shutil
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
 
-            pdf_doc = fitz.open(input_file)
-            page_count = pdf_doc.page_count
-            logger.info(f"📄 Processing {page_count} pages with PyMuPDF...")
+    def gauge(self, name, help_text, read, label=None):
+        return self._add(Gauge(name, help_text, read, label))
 
-            jobs[job_id]['pages_total'] = page_count
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
 
-            temp_dir = tempfile.mkdtemp()
-            page_pdfs = []
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(_metric_line(*sample) for sample in metric.samples())
+        return '\n'.join(lines) + '\n'
 
+
+def directory_bytes(path):
+    """Total size of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
             try:
-                for page_num in range(page_count):
-                    # Update progress
-                    progress = 30 + (page_num / page_count) * 50
-                    jobs[job_id]['progress'] = int(progress)
-                    jobs[job_id]['message'] = f'Processing page {page_num + 1}/{page_count}...'
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def resident_memory_bytes(pid='self'):
+    """Resident set size of a process, or None where /proc isn't available"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
 
-                    logger.info(f"📄 Processing page {page_num + 1}/{page_count}")
 
-                    page = pdf_doc[page_num]
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
+def cpu_seconds():
+    """CPU time used by this process plus the subprocesses it has waited for"""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
 
-                    img_path = os.path.join(temp_dir, f"page_{page_num:04d}.png")
-                    pix.save(img_path)
 
-                    pdf_base = os.path.join(temp_dir, f"page_{page_num:04d}")
-                    cmd = ['tesseract', img_path, pdf_base, 'pdf']
+class JobTrace:
+    """Timed spans for one job, in Chrome trace-event format. Does nothing when disabled.
 
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+    Timestamps are wall-clock microseconds, so spans recorded in page pool
+    processes line up with the ones recorded by the job's worker thread.
+    """
 
-                    page_pdf = pdf_base + '.pdf'
-                    if result.returncode == 0 and os.path.exists(page_pdf):
-                        page_pdfs.append(page_pdf)
-                        logger.info(f"✅ Page {page_num + 1} OCR complete")
+    def __init__(self, enabled, tid=None):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.tid = threading.get_ident() if tid is None else tid
+        self.events = []
 
-                pdf_doc.close()
+    def add(self, name, start, end=None, **args):
+        """Record a span from start (a time.time() value) until end or now"""
+        if not self.enabled:
+            return
+        end = time.time() if end is None else end
+        self.events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': round(start * 1e6),
+            'dur': round((end - start) * 1e6),
+            'pid': self.pid,
+            'tid': self.tid,
+            'args': args
+        })
 
-                jobs[job_id]['progress'] = 85
-                jobs[job_id]['message'] = f'Merging {len(page_pdfs)} pages...'
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Time a block; it can add to the yielded args while it runs"""
+        start = time.time()
+        try:
+            yield args
+        finally:
+            self.add(name, start, **args)
 
-                # Merge pages
-                if page_pdfs:
-                    if len(page_pdfs) == 1:
-                        shutil.copy2(page_pdfs[0], output_temp.name)
-                    else:
-                        try:
-                            import pikepdf
-                            merged_pdf = pikepdf.Pdf.new()
+    def extend(self, events):
+        if self.enabled and events:
+            self.events.extend(events)
 
-                            for page_pdf in page_pdfs:
-                                if os.path.exists(page_pdf):
-                                    src_pdf = pikepdf.Pdf.open(page_pdf)
-                                    merged_pdf.pages.extend(src_pdf.pages)
-                                    src_pdf.close()
+    def save(self, path, label):
+        """Write the trace, naming the worker thread's track after the job"""
+        if not self.enabled:
+            return
+        names = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'OCR worker'}},
+                 {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': self.tid, 'args': {'name': label}}]
+        for pid in sorted({event['pid'] for event in self.events} - {self.pid}):
+            names.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f'Page pool ({pid})'}})
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'traceEvents': names + self.events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(path + '.tmp', path)
 
-                            merged_pdf.save(output_temp.name)
-                            merged_pdf.close()
-                            logger.info(f"✅ Merged {len(page_pdfs)} pages!")
 
-                        except ImportError:
-                            shutil.copy2(page_pdfs[0], output_temp.name)
-                            logger.info("✅ Used first page (pikepdf not available)")
+def trace_path(job_id):
+    return os.path.join(TRACE_DIR, f"{job_id}.json")
 
-                else:
-                    raise Exception("No pages could be processed")
 
-            finally:
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
+metrics = MetricsRegistry()
+upload_seconds = metrics.histogram('ocr_upload_seconds', 'Time to receive and store an upload request')
+validation_seconds = metrics.histogram('ocr_validation_seconds', 'Time spent checking an input file before OCR')
+page_render_seconds = metrics.histogram('ocr_page_render_seconds', 'Time to rasterize and encode one page')
+page_ocr_seconds = metrics.histogram('ocr_page_tesseract_seconds', 'Time the OCR engine spent on one page')
+merge_seconds = metrics.histogram('ocr_merge_seconds', 'Time spent merging OCR pages into a job\'s output')
+queue_wait_seconds = metrics.histogram('ocr_queue_wait_seconds', 'Time jobs waited in the queue')
+job_seconds = metrics.histogram('ocr_job_seconds', 'Time from upload to finished job')
+jobs_completed_total = metrics.counter('ocr_jobs_completed_total', 'Jobs that finished successfully')
+jobs_failed_total = metrics.counter('ocr_jobs_failed_total', 'Jobs that failed')
+pages_processed_total = metrics.counter('ocr_pages_processed_total', 'Pages OCR\'d or taken from the page cache')
+pages_failed_total = metrics.counter('ocr_pages_failed_total', 'Pages whose OCR failed')
+pages_skipped_total = metrics.counter('ocr_pages_skipped_total', 'Pages kept as-is because they already had text')
+output_bytes_saved_total = metrics.counter(
+    'ocr_output_bytes_saved_total', 'Estimated output bytes saved by sharing duplicate resources and recompressing images')
+http_requests_total = metrics.counter('ocr_http_requests_total', 'HTTP requests served', ('endpoint', 'status'))
 
-        # Check output
-        if not os.path.exists(output_temp.name) or os.path.getsize(output_temp.name) == 0:
-            raise Exception("No valid output generated")
+def engine_name():
+    """The OCR engine pool processes will use"""
+    if OCR_ENGINE in ('auto', 'tesserocr'):
+        try:
+            import tesserocr  # noqa: F401
+            return 'tesserocr'
+        except ImportError:
+            if OCR_ENGINE == 'tesserocr':
+                logger.warning("⚠️ tesserocr not installed, falling back to the tesseract CLI")
+    return 'subprocess'
 
-        output_size = os.path.getsize(output_temp.name)
 
-        # Store results
-        jobs[job_id]['status'] = 'completed'
-        jobs[job_id]['progress'] = 100
-        jobs[job_id]['message'] = 'Conversion completed successfully!'
-        jobs[job_id]['output_file'] = output_temp.name
-        jobs[job_id]['output_size'] = output_size
-        jobs[job_id]['pages_processed'] = jobs[job_id].get('pages_total', 1)
-        jobs[job_id]['processing_time'] = time.time() - jobs[job_id]['start_time']
+def log_engine():
+    """Say at startup which engine pages will go through"""
+    if engine_name() == 'tesserocr':
+        logger.info(f"🔤 OCR engine: warm tesserocr instance per language ({engine_version()})")
+    elif OCR_ENGINE == 'auto':
+        logger.info(f"🔤 OCR engine: tesseract CLI per page ({engine_version()}); "
+                    f"install tesserocr for warm engines")
+    else:
+        logger.info(f"🔤 OCR engine: tesseract CLI per page ({engine_version()})")
 
-        logger.info(f"✅ Job {job_id} completed successfully! Output: {output_size} bytes")
 
-    except Exception as e:
-        logger.error(f"❌ Job {job_id} failed: {e}")
-        jobs[job_id]['status'] = 'failed'
-        jobs[job_id]['error'] = str(e)
+_engine_version = None
 
-        # Cleanup
+
+def engine_version():
+    """OCR engine and tesseract version, probed once and reused for cache keys"""
+    global _engine_version
+    if _engine_version is None:
         try:
-            if 'output_temp' in locals() and os.path.exists(output_temp.name):
-                os.unlink(output_temp.name)
-        except:
-            pass
+            if engine_name() == 'tesserocr':
+                import tesserocr
+                _engine_version = 'tesserocr ' + tesserocr.tesseract_version().split('\n')[0]
+            else:
+                result = subprocess.run(['tesseract', '--version'], capture_output=True, text=True, timeout=5)
+                _engine_version = result.stdout.split('\n')[0] if result.returncode == 0 else 'unknown'
+        except Exception:
+            return 'unknown'
+    return _engine_version
 
-    finally:
-        # Cleanup input file
+
+def result_cache_key(content_hash, language, force_ocr, jpeg_quality=0):
+    """Cache key for a finished OCR output: input bytes plus every setting that changes the result"""
+    settings = json.dumps([content_hash, language, force_ocr, jpeg_quality, OCR_TARGET_DPI, OCR_MAX_PAGE_PIXELS,
+                           engine_version()])
+    return hashlib.sha256(settings.encode()).hexdigest()
+
+
+def page_cache_key(pix, language):
+    """Cache key for one page: its rendered pixels and resolution (which sets the output page size) plus the OCR settings"""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([pix.width, pix.height, pix.n, pix.xres, pix.yres, language, engine_version()]).encode())
+    hasher.update(pix.samples)
+    return hasher.hexdigest()
+
+
+def image_cache_key(image_bytes, language):
+    """Cache key for one image frame: its encoded bytes plus the OCR settings"""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(['image', language, engine_version()]).encode())
+    hasher.update(image_bytes)
+    return hasher.hexdigest()
+
+
+class InvalidUploadError(Exception):
+    """Raised when an upload is rejected before any OCR work starts"""
+
+
+def check_header(header, allow_zip=False):
+    """Reject files that aren't PDFs or supported images (or ZIP archives, for batches) as soon as their first bytes arrive"""
+    if allow_zip and header.startswith(ZIP_MAGIC):
+        return
+    if not any(header.startswith(signature) for signature, _ in INPUT_SIGNATURES):
+        raise InvalidUploadError("Unsupported file type (upload a PDF, JPG, PNG or TIFF)")
+
+
+def save_upload(stream, path):
+    """Stream an uploaded file to disk, returning the SHA-256 of its contents"""
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as out:
+        first = True
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if first:
+                check_header(chunk)
+                first = False
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise InvalidUploadError("File too large")
+            hasher.update(chunk)
+            out.write(chunk)
+    if first:
+        raise InvalidUploadError("Input file is empty")
+    return hasher.hexdigest()
+
+
+# Chunked upload sessions: upload_id -> session dict. Each session is mirrored
+# to a JSON file next to its data so uploads can resume after a restart.
+uploads = {}
+uploads_lock = threading.Lock()
+
+
+def _upload_paths(upload_id):
+    base = os.path.join(UPLOAD_DIR, upload_id)
+    return base + '.json', base + '.part'
+
+
+def _save_upload_session(session):
+    meta_path, _ = _upload_paths(session['id'])
+    meta = {key: session[key] for key in ('id', 'filename', 'size', 'received', 'created', 'updated')}
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def get_upload_session(upload_id):
+    """Look up an upload session, reloading it from disk if needed.
+
+    The JSON file is the source of truth, so chunks for one upload may land on
+    different worker processes. Each process hashes the chunks it appends while
+    it has seen every chunk so far; once another process has appended, the
+    session carries no hash and finalize hashes the whole file once instead.
+    """
+    if not re.match(r'^[0-9a-f]{32}$', upload_id):
+        return None
+
+    with uploads_lock:
+        meta_path, data_path = _upload_paths(upload_id)
         try:
-            if os.path.exists(input_file):
-                os.unlink(input_file)
-        except:
-            pass
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            uploads.pop(upload_id, None)
+            return None
 
-@app.route('/')
-def home():
-    return render_template_string(HTML_TEMPLATE)
+        # Reuse our session unless another worker process has appended since
+        session = uploads.get(upload_id)
+        if session is not None and session['received'] == meta['received']:
+            return session
+        # Hash state can't be shared between processes or survive a restart
+        session = dict(meta, hasher=None, lock=threading.Lock())
+        uploads[upload_id] = session
+        return session
 
-@app.route('/start-conversion', methods=['POST'])
-def start_conversion():
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
 
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return hasher.hexdigest()
+            hasher.update(chunk)
 
-        # Generate unique job ID
-        job_id = str(uuid.uuid4())
 
-        # Save file
-        input_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        file.save(input_temp.name)
-        input_temp.close()
+def discard_upload_session(upload_id):
+    with uploads_lock:
+        uploads.pop(upload_id, None)
+    for path in _upload_paths(upload_id):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
 
-        # Initialize job
-        jobs[job_id] = {
-            'status': 'started',
-            'progress': 0,
-            'message': 'Job initialized...',
-            'filename': file.filename,
-            'start_time': time.time()
-        }
 
-        # Start background processing
-        thread = threading.Thread(target=process_pdf_background, 
-                                 args=(job_id, input_temp.name, file.filename))
-        thread.daemon = True
-        thread.start()
+def prune_upload_sessions():
+    """Drop uploads that haven't received a chunk in UPLOAD_IDLE_SECONDS"""
+    cutoff = time.time() - UPLOAD_IDLE_SECONDS
+    for entry in os.scandir(UPLOAD_DIR):
+        if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+            upload_id = entry.name[:-len('.json')]
+            logger.info(f"🧹 Discarding idle upload {upload_id}")
+            discard_upload_session(upload_id)
 
-        logger.info(f"🚀 Started job {job_id} for file: {file.filename}")
 
-        return jsonify({
-            'job_id': job_id,
-            'status': 'started',
-            'message': 'Processing started'
-        })
+def choose_render_dpi(page):
+    """Pick the resolution to rasterize a page at for OCR"""
+    import fitz
 
-    except Exception as e:
-        logger.error(f"❌ Failed to start conversion: {e}")
-        return jsonify({'error': str(e)}), 500
+    dpi = OCR_TARGET_DPI
 
-@app.route('/job-status/<job_id>')
-def get_job_status(job_id):
-    if job_id not in jobs:
-        return jsonify({'error': 'Job not found'}), 404
+    # Native resolution of the largest image on the page, if it's big enough to be a scan
+    largest_area = SCAN_PAGE_COVERAGE * abs(page.rect)
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox'])
+        if bbox.is_empty or abs(bbox) < largest_area:
+            continue
+        largest_area = abs(bbox)
+        native_dpi = max(info['width'] / (bbox.width / 72), info['height'] / (bbox.height / 72))
+        dpi = min(OCR_TARGET_DPI, max(native_dpi * 2, OCR_MIN_DPI))
 
-    job = jobs[job_id]
-    return jsonify({
-        'status': job['status'],
-        'progress': job.get('progress', 0),
-        'message': job.get('message', 'Processing...'),
-        'filename': job.get('filename'),
-        'pages_processed': job.get('pages_processed'),
-        'processing_time': job.get('processing_time')
-    })
+    # Large-format pages: cap the pixel count
+    width_in, height_in = page.rect.width / 72, page.rect.height / 72
+    pixels = width_in * dpi * height_in * dpi
+    if pixels > OCR_MAX_PAGE_PIXELS:
+        dpi = dpi * math.sqrt(OCR_MAX_PAGE_PIXELS / pixels)
 
-@app.route('/download/<job_id>')
-def download_result(job_id):
-    if job_id not in jobs:
-        return jsonify({'error': 'Job not found'}), 404
+    return max(1, int(dpi))
 
-    job = jobs[job_id]
 
-    if job['status'] != 'completed':
-        return jsonify({'error': 'Job not completed'}), 400
+def classify_page(page):
+    """Classify a PDF page as 'text' (usable text layer), 'image' (no text) or 'mixed'"""
+    import fitz
 
-    if 'output_file' not in job or not os.path.exists(job['output_file']):
-        return jsonify({'error': 'Output file not found'}), 404
+    text_chars = len(page.get_text('text').strip())
+    if text_chars < MIN_TEXT_CHARS:
+        return 'image'
+
+    page_area = abs(page.rect) or 1
+    image_area = sum(abs(fitz.Rect(info['bbox']) & page.rect) for info in page.get_image_info())
+    if image_area / page_area > MAX_TEXT_PAGE_IMAGE_COVERAGE:
+        return 'mixed'
+    return 'text'
+
+
+def sniff_input(path):
+    """Identify an input and check it can be processed, without rendering anything.
+
+    Returns {'kind': ..., 'pages': ...}. Inputs that could only fail later
+    (empty, damaged, password-protected or unsupported) raise InvalidUploadError.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(16)
+    if not header:
+        raise InvalidUploadError("Input file is empty")
+    kind = next((kind for signature, kind in INPUT_SIGNATURES if header.startswith(signature)), None)
+    if kind is None:
+        raise InvalidUploadError("Unsupported file type (upload a PDF, JPG, PNG or TIFF)")
+    if kind != 'pdf':
+        return sniff_image(path, kind)
 
+    import fitz
     try:
-        filename = job['filename']
-        safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.')).strip()
-        download_filename = f"{os.path.splitext(safe_filename)[0]}_OCR.pdf"
-
-        return send_file(
-            job['output_file'],
-            as_attachment=True,
-            download_name=download_filename,
-            mimetype='application/pdf'
-        )
+        doc = fitz.open(path, filetype='pdf')
+    except Exception:
+        raise InvalidUploadError("PDF is damaged and can't be read")
+    with doc:
+        if doc.needs_pass:
+            raise InvalidUploadError("PDF is password-protected")
+        if doc.page_count == 0:
+            raise InvalidUploadError("PDF has no pages")
+        return {'kind': kind, 'pages': doc.page_count}
 
-    except Exception as e:
-        logger.error(f"❌ Download failed for job {job_id}: {e}")
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/test')
-def test():
+def sniff_image(path, kind):
+    """Count the frames of an image input (a multi-page TIFF has one per page)"""
+    from PIL import Image
+
     try:
-        result = subprocess.run(['tesseract', '--version'], 
-                              capture_output=True, text=True, timeout=5)
-        tesseract_version = result.stdout.split('\n')[0] if result.returncode == 0 else "Not found"
-    except:
-        tesseract_version = "Error checking"
+        with Image.open(path) as image:
+            return {'kind': kind, 'pages': getattr(image, 'n_frames', 1), 'pixels': image.width * image.height}
+    except Image.DecompressionBombError:
+        raise InvalidUploadError("Image is too large")
+    except Exception:
+        raise InvalidUploadError(f"{kind.upper()} image is damaged and can't be read")
 
-    return jsonify({
-        'status': 'working',
-        'flask': 'OK',
-        'tesseract': tesseract_version,
-        'active_jobs': len(jobs),
-        'polling_system': 'enabled'
-    })
 
-if __name__ == '__main__':
-    logger.info("🚀 Starting OCR PDF Converter with Polling System")
+def estimate_page_memory(pixels):
+    """Bytes a page of this many pixels (at OCR resolution) is expected to need while it's processed"""
+    return max(1, int(min(pixels, OCR_MAX_PAGE_PIXELS) * PAGE_MEMORY_BYTES_PER_PIXEL))
 
-    # Test dependencies
+
+def choose_strategy(probe, ocr_pages):
+    """How to process an input: 'copy' when no page needs OCR, 'image-ocr' for images, 'page-ocr' otherwise"""
+    if probe['kind'] != 'pdf':
+        # Each frame goes to the engine without rendering, then the pages are merged
+        return 'image-ocr'
+    if not ocr_pages:
+        # Every page already has a text layer: hand the input back as it is
+        return 'copy'
+    # Render and OCR the pages that need it in the page pool, merge the rest unchanged
+    return 'page-ocr'
+
+
+def estimate_seconds(probe, ocr_pages):
+    """Rough time to OCR and merge an input, from the page timings measured in this process"""
+    page_seconds = ((page_render_seconds.mean(0) + page_ocr_seconds.mean(0)) or DEFAULT_PAGE_SECONDS)
+    return math.ceil(len(ocr_pages) / OCR_PAGE_PROCESSES) * page_seconds + probe['pages'] * MERGE_PAGE_SECONDS
+
+
+def count_pages(path):
     try:
-        result = subprocess.run(['tesseract', '--version'], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0:
-            version = result.stdout.split('\n')[0]
-            logger.info(f"✅ Tesseract found: {version}")
-        else:
-            logger.warning("⚠️ Tesseract not responding properly")
-    except:
-        logger.warning("⚠️ Could not verify Tesseract installation")
+        import fitz
+        with fitz.open(path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+_page_pool = None
+_page_pool_lock = threading.Lock()
+_open_documents = collections.OrderedDict()
+
+
+def get_page_pool():
+    """Return the shared page OCR process pool, creating it on first use"""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            # Lets the pool processes, which import this module, tell they aren't a server
+            os.environ['OCR_PAGE_POOL_PARENT'] = str(os.getpid())
+            _page_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=OCR_PAGE_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_page_worker
+            )
+            logger.info(f"⚙️ Started page pool with {OCR_PAGE_PROCESSES} processes ({engine_name()} engine)")
+        return _page_pool
+
+
+class PageScheduler:
+    """Feeds pages from every running job to the page pool in weighted fair order.
+
+    Jobs queue their pages here rather than on the pool, and only PAGE_SLOTS
+    pages are in the pool at once, so a job that starts later doesn't wait
+    behind every page queued before it. When a slot frees up, the next page
+    comes from the job with the fewest pages left among small ones (at most
+    SMALL_JOB_PAGES left, not low priority), or else from the job with the
+    lowest virtual time. A job's virtual time advances by 1/weight for each
+    page it gets, so running jobs share the pool in proportion to their weights.
+
+    Pages are only dispatched while their estimated memory fits the budget
+    shared by every job in this process; the job gives it back with release()
+    once the page has been merged.
+    """
+
+    def __init__(self, slots, memory_capacity):
+        self.slots = slots
+        self.memory_capacity = memory_capacity
+        self.memory_reserved = 0
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._granted = {}
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        self._thread = None
+
+    def register(self, job_id, priority, pages):
+        """Start scheduling a job that has this many pages to OCR"""
+        with self._cond:
+            self._jobs[job_id] = {
+                'weight': PRIORITY_WEIGHTS[priority],
+                'small': priority != 'low',
+                'remaining': pages,
+                'vtime': self._virtual_time,
+                'queue': collections.deque(),
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ocr-page-dispatcher', daemon=True)
+                self._thread.start()
+
+    def unregister(self, job_id):
+        """Stop scheduling a job, cancelling its pages that haven't been dispatched"""
+        with self._cond:
+            state = self._jobs.pop(job_id, None)
+        for future, *_ in state['queue'] if state else ():
+            future.cancel()
+
+    def submit(self, job_id, memory, fn, *args):
+        """Queue fn(*args) for one of a job's pages, returning a future for its result"""
+        future = concurrent.futures.Future()
+        with self._cond:
+            state = self._jobs[job_id]
+            if not state['queue']:
+                # A job that sat idle (merging, or waiting on its own window)
+                # rejoins at the current virtual time instead of banking its share
+                state['vtime'] = max(state['vtime'], self._virtual_time)
+            state['queue'].append((future, memory, fn, args))
+            self._cond.notify_all()
+        return future
+
+    def release(self, future):
+        """Give back the memory reserved for a page when it was dispatched"""
+        with self._cond:
+            self.memory_reserved -= self._granted.pop(future, 0)
+            self._cond.notify_all()
+
+    def backlog(self):
+        """Pages queued here, waiting for a slot in the pool"""
+        with self._cond:
+            return sum(len(state['queue']) for state in self._jobs.values())
+
+    def _next_job(self):
+        backlogged = [state for state in self._jobs.values() if state['queue']]
+        small = [state for state in backlogged if state['small'] and state['remaining'] <= SMALL_JOB_PAGES]
+        if small:
+            return min(small, key=lambda state: (state['remaining'], state['vtime']))
+        return min(backlogged, key=lambda state: state['vtime'], default=None)
+
+    def _next_task(self):
+        """Take the next page to dispatch (with the lock held), or None if nothing can go yet.
+
+        Memory requests are capped at the capacity, so a page bigger than the
+        whole budget still runs, just on its own.
+        """
+        while self._in_flight < self.slots:
+            state = self._next_job()
+            if state is None:
+                return None
+            future, memory, fn, args = state['queue'][0]
+            granted = min(memory, self.memory_capacity)
+            if future.cancelled():
+                state['queue'].popleft()
+                continue
+            if self.memory_reserved and self.memory_reserved + granted > self.memory_capacity:
+                return None
+            state['queue'].popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            state['remaining'] -= 1
+            self._virtual_time = state['vtime']
+            state['vtime'] += 1 / state['weight']
+            self._granted[future] = granted
+            self.memory_reserved += granted
+            self._in_flight += 1
+            return future, fn, args
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    self._cond.wait()
+                    task = self._next_task()
+            future, fn, args = task
+            try:
+                pool_future = get_page_pool().submit(fn, *args)
+            except Exception as e:
+                self._finished(future, None, e)
+                continue
+            pool_future.add_done_callback(lambda done, future=future: self._finished(future, done))
+
+    def _finished(self, future, pool_future, error=None):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+        if pool_future is not None:
+            if pool_future.cancelled():
+                error = concurrent.futures.CancelledError()
+            else:
+                error = pool_future.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(pool_future.result())
+
+
+page_scheduler = PageScheduler(PAGE_SLOTS, MEMORY_BUDGET_BYTES)
+
+
+def reset_page_pool():
+    """Drop a broken page pool (e.g. a child was OOM-killed) so the next job gets a fresh one"""
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is not None:
+            _page_pool.shutdown(wait=False, cancel_futures=True)
+            _page_pool = None
+
+
+def _open_document(path):
+    """Keep recently used documents open in each pool process"""
+    import fitz
+
+    key = (path, os.stat(path).st_mtime_ns)
+    doc = _open_documents.get(key)
+    if doc is None:
+        doc = fitz.open(path)
+        _open_documents[key] = doc
+        while len(_open_documents) > OPEN_DOCUMENTS_PER_PROCESS:
+            _, old_doc = _open_documents.popitem(last=False)
+            old_doc.close()
+    else:
+        _open_documents.move_to_end(key)
+    return doc
+
+
+class SubprocessEngine:
+    """Runs the tesseract CLI once per page"""
+
+    name = 'subprocess'
+
+    def __init__(self, language):
+        self.language = language
+        self.pages = 0
+
+    def recognize(self, image_bytes, scratch_dir=None):
+        """OCR one PNG or JPEG image, returning single-page PDF bytes (None on failure).
+
+        Without a scratch_dir the image and PDF go through stdin/stdout;
+        with one they go through files in it.
+        """
+        if scratch_dir is None:
+            cmd = ['tesseract', 'stdin', 'stdout', '-l', self.language, 'pdf']
+            result = subprocess.run(cmd, input=image_bytes, capture_output=True, timeout=120, env=TESSERACT_ENV)
+            if result.returncode == 0 and result.stdout.startswith(b'%PDF'):
+                return result.stdout
+            self._log_failure(result.stderr)
+            return None
+
+        base = os.path.join(scratch_dir, uuid.uuid4().hex)
+        with open(base + '.png', 'wb') as f:
+            f.write(image_bytes)
+        try:
+            cmd = ['tesseract', base + '.png', base, '-l', self.language, 'pdf']
+            result = subprocess.run(cmd, capture_output=True, timeout=120, env=TESSERACT_ENV)
+            if result.returncode == 0 and os.path.exists(base + '.pdf'):
+                with open(base + '.pdf', 'rb') as f:
+                    return f.read()
+            self._log_failure(result.stderr)
+            return None
+        finally:
+            for path in (base + '.png', base + '.pdf'):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def _log_failure(self, stderr):
+        logger.warning(f"⚠️ tesseract failed: {stderr.decode(errors='replace').strip()[:200]}")
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """Long-lived tesseract API with the language model already loaded"""
+
+    name = 'tesserocr'
+
+    def __init__(self, language):
+        import tesserocr
+
+        self.language = language
+        self.pages = 0
+        self.api = tesserocr.PyTessBaseAPI(lang=language)
+        self.api.SetVariable('tessedit_create_pdf', 'T')
+        # The PDF renderer writes <outputbase>.pdf; one scratch dir per process
+        # holds at most one page at a time
+        self.scratch_dir = tempfile.mkdtemp(prefix='tesserocr-')
+
+    def recognize(self, image_bytes, scratch_dir=None):
+        """OCR one PNG or JPEG image, returning single-page PDF bytes (None on failure)"""
+        from PIL import Image
+
+        base = os.path.join(self.scratch_dir, 'page')
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                ok = self.api.ProcessPage(base, image, 0, 'page.png', timeout=120000)
+            if ok and os.path.exists(base + '.pdf'):
+                with open(base + '.pdf', 'rb') as f:
+                    return f.read()
+            return None
+        finally:
+            if os.path.exists(base + '.pdf'):
+                os.unlink(base + '.pdf')
+
+    def close(self):
+        self.api.End()
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+# Warm engines in this (pool) process, by language
+_engines = {}
+
+
+def get_engine(language):
+    """Return this process's engine for a language, recycling it after ENGINE_RECYCLE_PAGES pages"""
+    engine = _engines.get(language)
+    if engine is not None and engine.pages >= ENGINE_RECYCLE_PAGES:
+        engine.close()
+        engine = None
+
+    if engine is None:
+        if engine_name() == 'tesserocr':
+            try:
+                engine = TesserocrEngine(language)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not start tesserocr for {language}, using the CLI: {e}")
+        if engine is None:
+            engine = SubprocessEngine(language)
+        _engines[language] = engine
+    return engine
+
+
+def init_page_worker():
+    """Pool process initializer: warm up the default language before the first page arrives"""
+    try:
+        get_engine(OCR_LANGUAGE)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not warm up OCR engine: {e}")
+
+
+def read_frame(input_file, frame_num):
+    """One frame of an image input, encoded for the OCR engine.
+
+    Returns (image_bytes, dpi, (width, height)). Single-frame PNG and JPEG
+    files that record their resolution go to the engine as they are, so
+    nothing is decoded here. TIFF frames, rotated photos and images without a
+    resolution or above OCR_MAX_PAGE_MEGAPIXELS are re-encoded as PNG.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(input_file) as image:
+        image.seek(frame_num)
+        dpi = image.info.get('dpi', (0, 0))[0]
+        if dpi < OCR_MIN_DPI:
+            dpi = None
+        width, height = image.size
+        scale = min(1.0, math.sqrt(OCR_MAX_PAGE_PIXELS / (width * height)))
+        rotated = image.getexif().get(0x0112, 1) != 1  # EXIF orientation, which tesseract ignores
+
+        if (image.format in ('PNG', 'JPEG') and getattr(image, 'n_frames', 1) == 1
+                and dpi and scale == 1 and not rotated):
+            with open(input_file, 'rb') as f:
+                return f.read(), round(dpi), (width, height)
+
+        # Without a recorded resolution, assume the usual scanning resolution
+        dpi = (dpi or OCR_TARGET_DPI) * scale
+        frame = ImageOps.exif_transpose(image) if rotated else image
+        if frame.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+            frame = frame.convert('RGB')
+        if scale < 1:
+            frame = frame.resize((max(1, round(frame.width * scale)), max(1, round(frame.height * scale))),
+                                 Image.LANCZOS)
+        buffer = io.BytesIO()
+        frame.save(buffer, format='PNG', dpi=(dpi, dpi))
+        return buffer.getvalue(), round(dpi), frame.size
+
+
+def ocr_page(input_file, page_num, temp_dir, language, traced=False, kind='pdf'):
+    """Render one page (or read one image frame) and OCR it (runs in a pool process).
+
+    Pages whose pixels were seen before are taken from the page cache instead
+    of going through the engine again. Returns a dict with the single-page PDF
+    (None if OCR failed), whether it was reused and the DPI the page was
+    rendered at, plus how long rendering and OCR took and, when traced, the
+    page's trace events. The PDF is returned as
+    bytes when temp_dir is None, otherwise as a path inside temp_dir.
+    """
+    import fitz
+
+    trace = JobTrace(traced, tid=0)
+    result = {'pdf': None, 'reused': False, 'dpi': None, 'render_seconds': None, 'ocr_seconds': None}
+    started = time.perf_counter()
+
+    if kind == 'pdf':
+        with trace.span('get_pixmap', page=page_num + 1) as span:
+            page = _open_document(input_file)[page_num]
+            dpi = result['dpi'] = choose_render_dpi(page)
+            pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72))
+            # Tell tesseract the real resolution so the PDF page keeps its size
+            pix.set_dpi(dpi, dpi)
+            span.update(dpi=dpi, width=pix.width, height=pix.height, pixmap_bytes=pix.stride * pix.height)
+        image_bytes = None
+    else:
+        with trace.span('read frame', page=page_num + 1) as span:
+            image_bytes, dpi, (width, height) = read_frame(input_file, page_num)
+            result['dpi'] = dpi
+            span.update(dpi=dpi, width=width, height=height, image_bytes=len(image_bytes))
+
+    with trace.span('page cache lookup', page=page_num + 1) as span:
+        cache_key = page_cache_key(pix, language) if image_bytes is None else image_cache_key(image_bytes, language)
+        pdf_bytes = page_cache.read(cache_key)
+        reused = result['reused'] = span['hit'] = pdf_bytes is not None
+    result['render_seconds'] = time.perf_counter() - started
+
+    if not reused:
+        if image_bytes is None:
+            with trace.span('png encode', page=page_num + 1) as span:
+                image_bytes = pix.tobytes('png')
+                span['png_bytes'] = len(image_bytes)
+            pix = None
+            result['render_seconds'] = time.perf_counter() - started
+
+        ocr_started = time.perf_counter()
+        cpu_started = cpu_seconds()
+        with trace.span('ocr', page=page_num + 1) as span:
+            engine = get_engine(language)
+            engine.pages += 1
+            span['engine'] = engine.name
+            try:
+                pdf_bytes = engine.recognize(image_bytes, temp_dir)
+            except Exception as e:
+                logger.warning(f"⚠️ {engine.name} engine failed on page {page_num + 1}: {e}")
+                pdf_bytes = None
+
+            if pdf_bytes is None and engine.name != 'subprocess':
+                # Keep the CLI as a fallback for pages the warm engine can't handle
+                span['engine'] = f'{engine.name}, then subprocess'
+                pdf_bytes = SubprocessEngine(language).recognize(image_bytes, temp_dir)
+
+            span.update(cpu_seconds=round(cpu_seconds() - cpu_started, 6), ok=pdf_bytes is not None)
+        result['ocr_seconds'] = time.perf_counter() - ocr_started
+
+        if pdf_bytes is None:
+            logger.warning(f"⚠️ Page {page_num + 1} OCR failed")
+            return dict(result, trace=trace.events)
+
+        # Eviction is left to the parent so pool processes don't all rescan the cache
+        with trace.span('page cache write', page=page_num + 1):
+            page_cache.write(cache_key, pdf_bytes, evict=False)
+
+    if temp_dir is None:
+        return dict(result, pdf=pdf_bytes, trace=trace.events)
+
+    page_pdf = os.path.join(temp_dir, f"page_{page_num:04d}.pdf")
+    with open(page_pdf, 'wb') as f:
+        f.write(pdf_bytes)
+    return dict(result, pdf=page_pdf, trace=trace.events)
+
+
+def job_dir(job_id):
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def write_job_checkpoint(job):
+    """Persist what's needed to restart a job: its metadata, with pages following as they finish"""
+    path = job_dir(job['id'])
+    os.makedirs(os.path.join(path, 'pages'), exist_ok=True)
+    with open(os.path.join(path, 'job.json.tmp'), 'w') as f:
+        json.dump(job, f)
+    os.replace(os.path.join(path, 'job.json.tmp'), os.path.join(path, 'job.json'))
+
+
+def checkpoint_page_path(job_id, page_num):
+    return os.path.join(job_dir(job_id), 'pages', f"page_{page_num:05d}.pdf")
+
+
+def write_page_checkpoint(job_id, page_num, page_pdf):
+    """Durably record a finished page (PDF bytes or a path to one)"""
+    path = checkpoint_page_path(job_id, page_num)
+    temp_path = path + '.tmp'
+    if isinstance(page_pdf, bytes):
+        with open(temp_path, 'wb') as f:
+            f.write(page_pdf)
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        link_or_copy(page_pdf, temp_path)
+    os.replace(temp_path, path)
+
+
+def remove_job_checkpoint(job_id):
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+def partial_output_path(job_id):
+    return os.path.join(job_dir(job_id), 'partial.pdf')
+
+
+def output_page_index(job, page_index):
+    """Where an input page ended up in the output, which leaves out pages that failed OCR"""
+    return page_index - sum(1 for failed in job.get('failed_pages', []) if failed < page_index)
+
+
+def extract_page(path, page_index):
+    """One page of a PDF as a PDF of its own"""
+    import pikepdf
+
+    buffer = io.BytesIO()
+    with pikepdf.Pdf.open(path) as src, pikepdf.Pdf.new() as out:
+        out.pages.append(src.pages[page_index])
+        out.save(buffer)
+    return buffer.getvalue()
+
+
+def batch_path(batch_id):
+    return os.path.join(BATCH_DIR, f"{batch_id}.json")
+
+
+def save_batch(batch):
+    with open(batch_path(batch['id']) + '.tmp', 'w') as f:
+        json.dump(batch, f)
+    os.replace(batch_path(batch['id']) + '.tmp', batch_path(batch['id']))
+
+
+def get_batch(batch_id):
+    if not re.match(r'^[0-9a-f]{32}$', batch_id):
+        return None
+    try:
+        with open(batch_path(batch_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def prune_batches():
+    """Forget batches once the reaper has removed all of their jobs"""
+    for entry in os.scandir(BATCH_DIR):
+        if not entry.name.endswith('.json'):
+            continue
+        batch = get_batch(entry.name[:-len('.json')])
+        if batch is not None and not any(job_id in jobs for job_id in batch['job_ids']):
+            logger.info(f"🧹 Discarding finished batch {batch['id']}")
+            os.unlink(entry.path)
+
+
+def zip_members(archive):
+    return [info for info in archive.infolist() if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+
+
+def zip_document_name(name):
+    """Whether a ZIP member is taken as a document (hidden files are skipped)"""
+    return bool(name) and not name.startswith('.')
+
+
+def count_batch_documents(files):
+    """How many documents a batch upload holds, reading only the directories of its ZIP archives"""
+    count = 0
+    for file in files:
+        header = file.stream.read(len(ZIP_MAGIC))
+        file.stream.seek(0)
+        if header != ZIP_MAGIC:
+            count += 1
+            continue
+        try:
+            with zipfile.ZipFile(file.stream) as archive:
+                count += sum(zip_document_name(os.path.basename(info.filename)) for info in zip_members(archive))
+        except zipfile.BadZipFile:
+            count += 1  # rejected on its own when the batch is unpacked
+        file.stream.seek(0)
+    return count
+
+
+def batch_uploads(files):
+    """Yield (filename, stream, error) for every document in a batch upload, unpacking ZIP archives"""
+    unpacked_bytes = 0
+    for file in files:
+        header = file.stream.read(len(ZIP_MAGIC))
+        file.stream.seek(0)
+        if header != ZIP_MAGIC:
+            yield file.filename, file.stream, None
+            continue
+
+        try:
+            with zipfile.ZipFile(file.stream) as archive:
+                members = zip_members(archive)
+                # Sizes come from the archive's directory, and extraction stops at them
+                size = sum(info.file_size for info in members)
+                if len(members) > MAX_ZIP_MEMBERS:
+                    yield file.filename, None, f'ZIP archive has more than {MAX_ZIP_MEMBERS} files'
+                    continue
+                if unpacked_bytes + size > MAX_BATCH_UNPACKED_BYTES:
+                    yield file.filename, None, (f'ZIP archives in this batch unpack to more than '
+                                                f'{MAX_BATCH_UNPACKED_BYTES // (1024 * 1024)}MB')
+                    continue
+                unpacked_bytes += size
+                for info in members:
+                    name = os.path.basename(info.filename)
+                    if not zip_document_name(name):
+                        continue
+                    if info.file_size > MAX_UPLOAD_BYTES:
+                        yield name, None, 'File too large'
+                        continue
+                    with archive.open(info) as member:
+                        yield name, member, None
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            # Corrupt, encrypted or using an unsupported compression method
+            yield file.filename, None, f'Unreadable ZIP archive: {e}'
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only sink that lets zipfile build an archive while it's being sent.
+
+    It isn't seekable, so zipfile writes sizes after each member's data instead
+    of going back to patch headers, and nothing is held beyond the current chunk.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        """Everything written since the last call"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+ORIGINAL_PAGE = object()  # marker: copy this page unchanged from the input
+
+
+def object_fingerprint(obj):
+    """Content hash of a PDF object and everything it references, plus the stream bytes in it.
+
+    Two objects with the same fingerprint are interchangeable, whichever
+    object numbers they have.
+    """
+    import pikepdf
+
+    hasher = hashlib.sha256()
+    stream_bytes = 0
+    visiting = set()
+
+    def visit(obj):
+        nonlocal stream_bytes
+        if isinstance(obj, pikepdf.Object) and obj.is_indirect:
+            if obj.objgen in visiting:
+                hasher.update(b'<cycle>')
+                return
+            visiting.add(obj.objgen)
+        if isinstance(obj, pikepdf.Stream):
+            data = obj.read_raw_bytes()
+            stream_bytes += len(data)
+            hasher.update(b'<stream %d>' % len(data))
+            hasher.update(data)
+            visit_dictionary(obj.stream_dict, skip=('/Length',))
+        elif isinstance(obj, pikepdf.Dictionary):
+            visit_dictionary(obj)
+        elif isinstance(obj, pikepdf.Array):
+            hasher.update(b'[')
+            for item in obj:
+                visit(item)
+            hasher.update(b']')
+        elif isinstance(obj, pikepdf.Object):
+            hasher.update(obj.unparse())
+        else:
+            hasher.update(repr(obj).encode())
+        if isinstance(obj, pikepdf.Object) and obj.is_indirect:
+            visiting.discard(obj.objgen)
+
+    def visit_dictionary(dictionary, skip=()):
+        hasher.update(b'<<')
+        for key in sorted(dictionary.keys()):
+            if key not in skip:
+                hasher.update(key.encode())
+                visit(dictionary[key])
+        hasher.update(b'>>')
+
+    visit(obj)
+    return hasher.hexdigest(), stream_bytes
+
+
+def recompress_images(page, quality, seen):
+    """Re-encode a page's 8-bit grey and RGB images as JPEG where that makes them smaller.
+
+    Returns (images recompressed, bytes saved). Images already handled on an
+    earlier page (by object number) are in seen and skipped.
+    """
+    import pikepdf
+    from pikepdf import PdfImage
+
+    recompressed, saved = 0, 0
+    xobjects = page.obj.get('/Resources', {}).get('/XObject', {})
+    for name in list(xobjects.keys()):
+        raw = xobjects[name]
+        if raw.get('/Subtype') != pikepdf.Name.Image or raw.objgen in seen:
+            continue
+        seen.add(raw.objgen)
+        if raw.get('/BitsPerComponent') != 8 or '/Decode' in raw:
+            continue
+        if raw.get('/ColorSpace') not in (pikepdf.Name.DeviceRGB, pikepdf.Name.DeviceGray):
+            continue
+        try:
+            image = PdfImage(raw).as_pil_image()
+        except Exception:
+            continue  # filters or layouts Pillow can't decode
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        old_size = len(raw.read_raw_bytes())
+        if buffer.tell() >= old_size:
+            continue
+        raw.write(buffer.getvalue(), filter=pikepdf.Name.DCTDecode)
+        if '/DecodeParms' in raw:
+            del raw['/DecodeParms']
+        recompressed += 1
+        saved += old_size - buffer.tell()
+    return recompressed, saved
+
+
+class PageMerger:
+    """Appends single-page PDFs to the output in page order as they become available.
+
+    Pages can be added in any order; each is merged as soon as every page
+    before it has arrived, so finished page PDFs don't pile up until the end.
+    With a chunk_dir, every MERGE_WINDOW_PAGES merged pages are written to a
+    chunk file there and dropped from memory; saving then streams the chunks
+    into one file with qpdf instead of holding the whole document, and shares
+    resources across chunks in a last pass over it.
+
+    Chunks are synced and listed in chunks.json as they're written, so the
+    pages in them are durable (pages_saved) and a merger opened on the same
+    chunk_dir after a crash carries on from the last chunk.
+    """
+
+    def __init__(self, input_file, jpeg_quality=0, chunk_dir=None):
+        import pikepdf
+
+        self.pdf = pikepdf.Pdf.new()
+        self.pages_merged = 0
+        self.pages_saved = 0
+        self.failed_pages = []
+        self.chunks = []
+        self.chunk_dir = chunk_dir
+        self.jpeg_quality = jpeg_quality
+        self.resources_shared = 0
+        self.images_recompressed = 0
+        self.bytes_saved = 0
+        self._input_file = input_file
+        self._source = None
+        self._pending = {}
+        self._next_page = 0
+        self._shared_resources = {}
+        self._dropped_resources = set()
+        self._recompressed_images = set()
+        if chunk_dir:
+            self._resume_chunks()
+
+    def _resume_chunks(self):
+        """Take over the chunks an interrupted run saved; anything else in chunk_dir is rebuilt"""
+        try:
+            with open(os.path.join(self.chunk_dir, 'chunks.json')) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = None
+        if saved and all(os.path.exists(os.path.join(self.chunk_dir, name)) for name in saved['chunks']):
+            self.chunks = [os.path.join(self.chunk_dir, name) for name in saved['chunks']]
+            self.pages_saved = self._next_page = saved['pages']
+            self.pages_merged = saved['pages_merged']
+            self.failed_pages = saved['failed_pages']
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        for entry in os.scandir(self.chunk_dir):
+            if entry.path not in self.chunks and entry.name != 'chunks.json':
+                os.unlink(entry.path)
+
+    def _save_manifest(self):
+        path = os.path.join(self.chunk_dir, 'chunks.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({
+                'chunks': [os.path.basename(chunk) for chunk in self.chunks],
+                'pages': self.pages_saved,
+                'pages_merged': self.pages_merged,
+                'failed_pages': self.failed_pages
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    @property
+    def pages_ready(self):
+        """Leading input pages that have been resolved (merged, or failed and left out)"""
+        return self._next_page
+
+    def add(self, page_num, page, owned=False):
+        """Add a page: PDF bytes, a PDF path, ORIGINAL_PAGE, or None for a page that failed.
+
+        A path that is owned is deleted once the page has been merged.
+        """
+        self._pending[page_num] = (page, owned)
+        while self._next_page in self._pending:
+            page, owned = self._pending.pop(self._next_page)
+            self._append(self._next_page, page)
+            if owned:
+                os.unlink(page)
+            if page is None:
+                self.failed_pages.append(self._next_page)
+            self._next_page += 1
+            if self.chunk_dir and len(self.pdf.pages) >= MERGE_WINDOW_PAGES:
+                self._flush_chunk()
+
+    def _flush_chunk(self):
+        """Move the pages merged in memory into a chunk file"""
+        import pikepdf
+
+        path = os.path.join(self.chunk_dir, f"chunk_{len(self.chunks):05d}.pdf")
+        self.pdf.save(path)
+        self.pdf.close()
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+        self.chunks.append(path)
+        self.pages_saved = self._next_page
+        self._save_manifest()
+        self.pdf = pikepdf.Pdf.new()
+        # Resources can only be shared within one chunk until save() joins them
+        self._shared_resources = {}
+        self._dropped_resources = set()
+
+    def _append(self, page_num, page):
+        import pikepdf
+
+        if page is None:
+            return
+        if page is ORIGINAL_PAGE:
+            if self._source is None:
+                self._source = pikepdf.Pdf.open(self._input_file)
+            self.pdf.pages.append(self._source.pages[page_num])
+        else:
+            src_pdf = pikepdf.Pdf.open(io.BytesIO(page) if isinstance(page, bytes) else page)
+            self.pdf.pages.extend(src_pdf.pages)
+            src_pdf.close()
+            if self.jpeg_quality:
+                recompressed, saved = recompress_images(self.pdf.pages[-1], self.jpeg_quality,
+                                                        self._recompressed_images)
+                self.images_recompressed += recompressed
+                self.bytes_saved += saved
+        self._share_resources(self.pdf.pages[-1])
+        self.pages_merged += 1
+
+    def _share_resources(self, page):
+        """Point a new page at identical fonts (and other small resources) already in the output"""
+        import pikepdf
+
+        resources = page.obj.get('/Resources')
+        if not isinstance(resources, pikepdf.Dictionary):
+            return
+        for category in SHARED_RESOURCE_TYPES:
+            entries = resources.get(category)
+            if not isinstance(entries, pikepdf.Dictionary):
+                continue
+            for name in list(entries.keys()):
+                resource = entries[name]
+                if not isinstance(resource, pikepdf.Object) or not resource.is_indirect:
+                    continue
+                fingerprint, stream_bytes = object_fingerprint(resource)
+                shared = self._shared_resources.setdefault(fingerprint, resource)
+                if shared.objgen != resource.objgen:
+                    # The page's own copy is left unreferenced and isn't written out
+                    entries[name] = shared
+                    if resource.objgen not in self._dropped_resources:
+                        # Pages of one chunk share its copy, which only goes once
+                        self._dropped_resources.add(resource.objgen)
+                        self.resources_shared += 1
+                        self.bytes_saved += stream_bytes
+
+    def save(self, output_file):
+        import pikepdf
+
+        if not self.chunks:
+            self.pdf.save(output_file, linearize=OCR_LINEARIZE,
+                          object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        else:
+            if len(self.pdf.pages):
+                self._flush_chunk()
+            # Pages in different chunks couldn't share resources yet; one more pass over the
+            # joined document does that (page contents are copied, not loaded, on save).
+            # The joined file takes the chunks' place, so they're deleted straight away
+            joined = os.path.join(self.chunk_dir, 'joined.pdf')
+            if self.chunks != [joined]:
+                self._concatenate(self.chunks, joined)
+                chunks, self.chunks = self.chunks, [joined]
+                self._save_manifest()
+                for path in chunks:
+                    os.unlink(path)
+            with pikepdf.open(joined) as pdf:
+                self._shared_resources = {}
+                self._dropped_resources = set()
+                for page in pdf.pages:
+                    self._share_resources(page)
+                pdf.save(output_file, linearize=OCR_LINEARIZE, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+        self.close()
+
+    def save_partial(self, output_file):
+        """Write the pages merged so far, replacing output_file atomically"""
+        if not self.chunks:
+            self.pdf.save(output_file + '.tmp')
+        else:
+            window = os.path.join(self.chunk_dir, 'window.pdf')
+            self.pdf.save(window)
+            self._concatenate(self.chunks + [window] if len(self.pdf.pages) else self.chunks,
+                              output_file + '.tmp')
+            os.unlink(window)
+        os.replace(output_file + '.tmp', output_file)
+
+    @staticmethod
+    def _concatenate(paths, output_file, options=()):
+        """Join PDFs with qpdf, which copies page contents straight from the files instead of loading them"""
+        import pikepdf
+
+        pikepdf.Job(['qpdf', '--empty', *options, '--pages', *paths, '--', output_file]).run()
+
+    def close(self):
+        self.pdf.close()
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+        if self.chunk_dir:
+            shutil.rmtree(self.chunk_dir, ignore_errors=True)
+
+def process_pdf_background(job_id, input_file, original_filename):
+    """Background processing function"""
+    trace = JobTrace(OCR_TRACE_JOBS or (jobs.get(job_id) or {}).get('trace', False))
+    try:
+        processing_started = time.time()
+        update_job(
+            job_id,
+            status='processing',
+            message='Starting OCR processing...',
+            progress=10,
+            processing_started=processing_started
+        )
+        job = jobs.get(job_id)
+        language = job.get('language', OCR_LANGUAGE)
+        force_ocr = job.get('force_ocr', False)
+        complete = True
+        bytes_saved = 0
+        queue_wait_seconds.observe(max(0, processing_started - job['start_time']))
+        trace.add('queued', job['start_time'], processing_started)
+        validation_started = time.perf_counter()
+        stage_started = time.time()
+
+        logger.info(f"🚀 Background processing started for job {job_id}")
+
+        output_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=OUTPUT_DIR)
+        output_temp.close()
+
+        # Validate input (uploads were checked already; this catches files damaged since)
+        input_size = os.path.getsize(input_file)
+        logger.info(f"📊 Processing file: {original_filename} ({input_size} bytes)")
+        probe = sniff_input(input_file)
+
+        validation_seconds.observe(time.perf_counter() - validation_started)
+        trace.add('validate', stage_started, bytes=input_size, kind=probe['kind'])
+        update_job(job_id, progress=20, message='Checking pages...')
+
+        # Pre-pass: pages with a usable text layer don't need OCR (images never have one)
+        stage_started = time.time()
+        if probe['kind'] == 'pdf':
+            import fitz
+
+            page_types, page_memory = [], []
+            with fitz.open(input_file) as pdf_doc:
+                page_count = pdf_doc.page_count
+                for page in pdf_doc:
+                    page_types.append(classify_page(page))
+                    page_memory.append(estimate_page_memory(abs(page.rect) * (OCR_TARGET_DPI / 72) ** 2))
+        else:
+            page_count = probe['pages']
+            page_types = ['image'] * page_count
+            page_memory = [estimate_page_memory(probe['pixels'])] * page_count
+        trace.add('classify pages', stage_started, pages=page_count)
+
+        needs_ocr = [force_ocr or page_type != 'text' for page_type in page_types]
+        ocr_pages = [page_num for page_num in range(page_count) if needs_ocr[page_num]]
+        strategy = choose_strategy(probe, ocr_pages)
+        estimated_seconds = estimate_seconds(probe, ocr_pages)
+        logger.info(f"📄 {page_count} pages, {len(ocr_pages)} need OCR: using {strategy} "
+                    f"(~{estimated_seconds:.0f}s, {OCR_PAGE_PROCESSES} processes)")
+
+        update_job(
+            job_id,
+            progress=30,
+            message=f'Running OCR on {len(ocr_pages)} pages...' if ocr_pages else 'Every page already has text...',
+            strategy=strategy,
+            estimated_seconds=round(estimated_seconds, 1),
+            pages_total=page_count,
+            page_types=page_types,
+            pages_skipped=page_count - len(ocr_pages)
+        )
+        pages_skipped_total.inc(page_count - len(ocr_pages))
+        trace.add('route', stage_started, strategy=strategy, estimated_seconds=round(estimated_seconds, 1))
+
+        if strategy == 'copy':
+            shutil.copy2(input_file, output_temp.name)
+            logger.info("✅ Every page already has text, copied input unchanged")
+        else:
+            temp_dir = None if OCR_STREAM_PAGES else tempfile.mkdtemp()
+            # Pages in chunks saved before a restart are taken over as they are
+            merger = PageMerger(input_file, job.get('jpeg_quality', 0), os.path.join(job_dir(job_id), 'merged'))
+            merge_time = 0.0
+            partial_pages = 0
+            partial_written_at = float('-inf')
+            checkpoints_dropped = 0
+
+            def drop_saved_checkpoints():
+                """Delete the page checkpoints of pages now durable in a merged chunk"""
+                nonlocal checkpoints_dropped
+                if OCR_CHECKPOINT_PAGES:
+                    for page_num in range(checkpoints_dropped, merger.pages_saved):
+                        remove_file(checkpoint_page_path(job_id, page_num))
+                checkpoints_dropped = merger.pages_saved
+
+            def refresh_partial():
+                """Publish the leading finished pages, at most every PARTIAL_RESULT_SECONDS"""
+                nonlocal partial_pages, partial_written_at
+                if (not OCR_PARTIAL_RESULTS or merger.pages_ready <= partial_pages
+                        or merger.pages_ready == page_count
+                        or time.monotonic() - partial_written_at < PARTIAL_RESULT_SECONDS):
+                    return
+                stage_started = time.time()
+                os.makedirs(job_dir(job_id), exist_ok=True)
+                merger.save_partial(partial_output_path(job_id))
+                partial_pages, partial_written_at = merger.pages_ready, time.monotonic()
+                update_job(job_id, pages_ready=merger.pages_ready, failed_pages=list(merger.failed_pages))
+                trace.add('save partial', stage_started, pages=merger.pages_ready)
+
+            try:
+                merge_started = time.perf_counter()
+                stage_started = time.time()
+                for page_num in range(merger.pages_ready, page_count):
+                    if not needs_ocr[page_num]:
+                        merger.add(page_num, ORIGINAL_PAGE)
+
+                # Pages finished before a restart come from the saved chunks, then their checkpoints
+                resumed_pages = [page_num for page_num in ocr_pages if page_num < merger.pages_ready]
+                if OCR_CHECKPOINT_PAGES:
+                    checkpointed = [page_num for page_num in ocr_pages if page_num >= merger.pages_ready
+                                    and os.path.exists(checkpoint_page_path(job_id, page_num))]
+                    for page_num in checkpointed:
+                        merger.add(page_num, checkpoint_page_path(job_id, page_num))
+                    resumed_pages += checkpointed
+                if resumed_pages:
+                    logger.info(f"♻️ Resuming job {job_id}: {len(resumed_pages)} pages already done")
+                    update_job(job_id, pages_resumed=len(resumed_pages))
+                drop_saved_checkpoints()
+                merge_time += time.perf_counter() - merge_started
+                trace.add('merge unchanged and resumed pages', stage_started, resumed=len(resumed_pages))
+                refresh_partial()
+
+                # Queue pages with the page scheduler in a window bounded by this
+                # job's memory budget; they may finish in any order and are merged
+                # as soon as all earlier pages are in, which releases their memory
+                ocr_started = time.time()
+                waiting = collections.deque(page_num for page_num in ocr_pages if page_num not in resumed_pages)
+                futures = {}
+                window = {}  # page_num -> future, holding its memory until the page is merged
+                page_scheduler.register(job_id, job.get('priority', DEFAULT_PRIORITY), len(waiting))
+
+                def submit_pages():
+                    """Top up the window, within this job's memory budget"""
+                    while waiting:
+                        page_num = waiting[0]
+                        if window and (sum(page_memory[p] for p in window) + page_memory[page_num]
+                                       > JOB_MEMORY_BUDGET_BYTES):
+                            return
+                        waiting.popleft()
+                        future = page_scheduler.submit(job_id, page_memory[page_num], ocr_page, input_file, page_num,
+                                                       temp_dir, language, trace.enabled, probe['kind'])
+                        futures[future] = page_num
+                        window[page_num] = future
+
+                pages_done = len(resumed_pages)
+                pages_reused = 0
+                page_dpi = [None] * page_count
+                try:
+                    submit_pages()
+                    while futures:
+                        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            page_num = futures.pop(future)
+                            page_pdf = None
+                            try:
+                                page_result = future.result()
+                                page_pdf = page_result['pdf']
+                                page_dpi[page_num] = page_result['dpi']
+                                page_render_seconds.observe(page_result['render_seconds'])
+                                if page_result['ocr_seconds'] is not None:
+                                    page_ocr_seconds.observe(page_result['ocr_seconds'])
+                                trace.extend(page_result['trace'])
+                                if page_pdf:
+                                    page_cache.record(page_result['reused'])
+                                if page_result['reused']:
+                                    pages_reused += 1
+                                    update_job(job_id, pages_reused=pages_reused)
+                            except concurrent.futures.process.BrokenProcessPool:
+                                raise
+                            except Exception as e:
+                                logger.warning(f"⚠️ Page {page_num + 1} failed: {e}")
+
+                            if page_pdf:
+                                pages_processed_total.inc()
+                                if OCR_CHECKPOINT_PAGES:
+                                    write_page_checkpoint(job_id, page_num, page_pdf)
+                            else:
+                                pages_failed_total.inc()
+                            merge_started = time.perf_counter()
+                            stage_started = time.time()
+                            merger.add(page_num, page_pdf, owned=temp_dir is not None)
+                            drop_saved_checkpoints()
+                            merge_time += time.perf_counter() - merge_started
+                            trace.add('merge page', stage_started, page=page_num + 1, ok=bool(page_pdf))
+                            refresh_partial()
+
+                            pages_done += 1
+                            progress = 30 + (pages_done / len(ocr_pages)) * 50
+                            update_job(
+                                job_id,
+                                progress=int(progress),
+                                message=f'Processed {pages_done}/{len(ocr_pages)} pages...',
+                                pages_done=pages_done,
+                                page_dpi=page_dpi
+                            )
+
+                            if page_pdf:
+                                logger.info(f"✅ Page {page_num + 1} OCR complete ({pages_done}/{len(ocr_pages)})")
+
+                        for page_num in [page_num for page_num in window if page_num < merger.pages_ready]:
+                            page_scheduler.release(window.pop(page_num))
+                        submit_pages()
+                except concurrent.futures.process.BrokenProcessPool:
+                    reset_page_pool()
+                    raise Exception("OCR worker process crashed")
+                finally:
+                    page_scheduler.unregister(job_id)
+                    for future in futures:
+                        future.cancel()
+                    for future in window.values():
+                        page_scheduler.release(future)
+                    page_cache.evict()
+                    trace.add('ocr pages', ocr_started, pages=len(ocr_pages) - len(resumed_pages) - len(waiting))
+
+                complete = merger.pages_merged == page_count
+
+                update_job(job_id, progress=85, message=f'Saving {merger.pages_merged} pages...',
+                           failed_pages=list(merger.failed_pages))
+
+                merge_started = time.perf_counter()
+                stage_started = time.time()
+                # The finished output supersedes the partial one; don't hold both on disk while saving
+                remove_file(partial_output_path(job_id))
+                if merger.pages_merged:
+                    merger.save(output_temp.name)
+                    logger.info(f"✅ Merged {merger.pages_merged} pages! Shared {merger.resources_shared} duplicate "
+                                f"resources, recompressed {merger.images_recompressed} images")
+                else:
+                    raise Exception("No pages could be processed")
+                merge_seconds.observe(merge_time + time.perf_counter() - merge_started)
+                bytes_saved = merger.bytes_saved
+                output_bytes_saved_total.inc(bytes_saved)
+                trace.add('save output', stage_started, pages=merger.pages_merged,
+                          resources_shared=merger.resources_shared,
+                          images_recompressed=merger.images_recompressed, bytes_saved=bytes_saved)
+
+            finally:
+                merger.close()
+                if temp_dir:
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+
+        # Check output
+        if not os.path.exists(output_temp.name) or os.path.getsize(output_temp.name) == 0:
+            raise Exception("No valid output generated")
+
+        output_size = os.path.getsize(output_temp.name)
+
+        # Only cache outputs where every page made it through OCR
+        job = jobs.get(job_id)
+        cache_key = job.get('cache_key')
+        if cache_key and complete:
+            stage_started = time.time()
+            result_cache.put(cache_key, output_temp.name)
+            trace.add('result cache put', stage_started)
+
+        # Store results; the trace goes first so it's there as soon as clients see the job finish
+        save_job_trace(job_id, trace, original_filename)
+        update_job(
+            job_id,
+            status='completed',
+            progress=100,
+            message='Conversion completed successfully!',
+            output_file=output_temp.name,
+            output_size=output_size,
+            estimated_bytes_saved=bytes_saved,
+            pages_processed=job.get('pages_total', 1),
+            pages_ready=job.get('pages_total', 1),
+            pages_reused=job.get('pages_reused', 0),
+            processing_time=time.time() - job['start_time']
+        )
+
+        jobs_completed_total.inc()
+        job_seconds.observe(time.time() - job['start_time'])
+        logger.info(f"✅ Job {job_id} completed successfully! Output: {output_size} bytes "
+                    f"(about {bytes_saved} saved by optimisation)")
+
+    except Exception as e:
+        logger.error(f"❌ Job {job_id} failed: {e}")
+        save_job_trace(job_id, trace, original_filename)
+        update_job(job_id, status='failed', error=str(e))
+        jobs_failed_total.inc()
+
+        # Cleanup
+        try:
+            if 'output_temp' in locals() and os.path.exists(output_temp.name):
+                os.unlink(output_temp.name)
+        except:
+            pass
+
+    finally:
+        # Cleanup input file and checkpoints (only a crash leaves them behind)
+        try:
+            if os.path.exists(input_file):
+                os.unlink(input_file)
+        except:
+            pass
+        remove_job_checkpoint(job_id)
+
+
+def save_job_trace(job_id, trace, filename):
+    try:
+        trace.save(trace_path(job_id), f'Job {filename}')
+    except OSError as e:
+        logger.warning(f"⚠️ Could not save trace for job {job_id}: {e}")
+
+def queue_order(job, seq):
+    """Sort key for queued jobs: highest priority first, then small jobs (fewest pages first), then arrival"""
+    priority = job.get('priority', DEFAULT_PRIORITY)
+    pages = job.get('pages_total') or float('inf')
+    small = pages <= SMALL_JOB_PAGES and priority != 'low'
+    return -PRIORITY_WEIGHTS[priority], not small, pages if small else 0, seq
+
+
+class MemoryJobStore:
+    """Job records and the job queue, kept in this process's memory.
+
+    Callers get copies; changes go through create/update/delete so the store
+    can be swapped for one shared between processes.
+    """
+
+    name = 'memory'
+    shared = False
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job, updated=time.time())
+
+    def enqueue(self, job):
+        """Create a job at the back of the queue"""
+        with self._lock:
+            self._jobs[job['id']] = dict(job, status='queued', updated=time.time())
+            self._queue.append(job['id'])
+
+    def _ordered_queue(self):
+        """Queued job ids in the order they'll start (lock held)"""
+        queued = [(queue_order(self._jobs[job_id], seq), job_id) for seq, job_id in enumerate(self._queue)
+                  if job_id in self._jobs and self._jobs[job_id]['status'] == 'queued']
+        return [job_id for _, job_id in sorted(queued)]
+
+    def claim(self, worker_id, max_pages=None):
+        """Take the next job in queue order for a worker, or None if there's none it can take.
+
+        With max_pages, only jobs known to have at most that many pages qualify.
+        """
+        with self._lock:
+            for job_id in self._ordered_queue():
+                job = self._jobs[job_id]
+                if max_pages is not None and (job.get('pages_total') or float('inf')) > max_pages:
+                    continue
+                self._queue.remove(job_id)
+                now = time.time()
+                job.update(status='processing', worker=worker_id, claimed_at=now, updated=now)
+                return dict(job)
+        return None
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job, or None"""
+        with self._lock:
+            try:
+                return self._ordered_queue().index(job_id) + 1
+            except ValueError:
+                return None
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._queue)
+
+    def queue_entries(self):
+        """Queued uploads, counting all of a batch's queued jobs as one"""
+        with self._lock:
+            return len({self._jobs[job_id].get('batch_id') or job_id for job_id in self._queue})
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated=time.time())
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            if job_id in self._queue:
+                self._queue.remove(job_id)
+
+    def all(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+# queue_order() as columns of the queued jobs in SQLiteJobStore
+_PRIORITY_SQL = f"COALESCE(json_extract(data, '$.priority'), '{DEFAULT_PRIORITY}')"
+_PAGES_SQL = "COALESCE(json_extract(data, '$.pages_total'), 9e999)"
+_SMALL_SQL = f"({_PAGES_SQL} <= {SMALL_JOB_PAGES} AND {_PRIORITY_SQL} != 'low')"
+QUEUE_ORDER_SQL = f"""
+    SELECT id, data, seq, {_PAGES_SQL} AS pages,
+           -CASE {_PRIORITY_SQL} {' '.join(f"WHEN '{name}' THEN {weight}" for name, weight in PRIORITY_WEIGHTS.items())}
+           END AS neg_weight,
+           NOT {_SMALL_SQL} AS big,
+           CASE WHEN {_SMALL_SQL} THEN {_PAGES_SQL} ELSE 0 END AS work
+    FROM jobs WHERE status = 'queued'
+"""
+
+
+class SQLiteJobStore:
+    """Job records and the job queue in a SQLite database shared by every worker process.
+
+    Each job is a JSON document plus the columns needed to query the queue.
+    Updates and claims run in IMMEDIATE transactions, so concurrent read-modify-
+    write cycles from different processes can't lose each other's changes.
+    """
+
+    name = 'sqlite'
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    seq INTEGER,
+                    updated REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, seq)")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _write(self, conn, job, seq=None):
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, status, seq, updated, data) VALUES (?, ?, ?, ?, ?)",
+            (job['id'], job['status'], seq, job['updated'], json.dumps(job))
+        )
+
+    def create(self, job):
+        with self._transaction() as conn:
+            self._write(conn, dict(job, updated=time.time()))
+
+    def enqueue(self, job):
+        with self._transaction() as conn:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs").fetchone()[0]
+            self._write(conn, dict(job, status='queued', updated=time.time()), seq)
+
+    def claim(self, worker_id, max_pages=None):
+        with self._transaction() as conn:
+            row = conn.execute(f"""
+                SELECT data FROM ({QUEUE_ORDER_SQL}) WHERE pages <= ?
+                ORDER BY neg_weight, big, work, seq LIMIT 1
+            """, (float('inf') if max_pages is None else max_pages,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            job = json.loads(row[0])
+            job.update(status='processing', worker=worker_id, claimed_at=now, updated=now)
+            self._write(conn, job)
+            return job
+
+    def queue_position(self, job_id):
+        row = self._connection().execute(f"""
+            WITH queued AS ({QUEUE_ORDER_SQL})
+            SELECT COUNT(*) FROM queued, queued AS job WHERE job.id = ?
+            AND (queued.neg_weight, queued.big, queued.work, queued.seq)
+                <= (job.neg_weight, job.big, job.work, job.seq)
+        """, (job_id,)).fetchone()
+        return row[0] or None
+
+    def queue_depth(self):
+        return self._connection().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def queue_entries(self):
+        return self._connection().execute("""
+            SELECT COUNT(DISTINCT COALESCE(json_extract(data, '$.batch_id'), id)) FROM jobs WHERE status = 'queued'
+        """).fetchone()[0]
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, job_id, **fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data, seq FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields, updated=time.time())
+            self._write(conn, job, row[1] if job['status'] == 'queued' else None)
+
+    def delete(self, job_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def all(self):
+        return [json.loads(row[0]) for row in self._connection().execute("SELECT data FROM jobs")]
+
+    def __contains__(self, job_id):
+        return self._connection().execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,)).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def create_job_store():
+    if OCR_JOB_STORE == 'sqlite':
+        return SQLiteJobStore(JOB_DB_PATH)
+    if OCR_JOB_STORE != 'memory':
+        logger.warning(f"⚠️ Unknown job store '{OCR_JOB_STORE}', keeping jobs in memory")
+    return MemoryJobStore()
+
+
+jobs = create_job_store()
+
+
+def remove_file(path):
+    """Delete a file, returning the bytes reclaimed (0 if it was already gone)"""
+    try:
+        stat = os.stat(path)
+        os.unlink(path)
+        # A file hard-linked into the result cache keeps its blocks
+        return stat.st_size if stat.st_nlink == 1 else 0
+    except OSError:
+        return 0
+
+
+class JobReaper:
+    """Background thread that forgets expired jobs and deletes their output files"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.jobs_evicted = 0
+        self.outputs_evicted = 0
+        self.bytes_reclaimed = 0
+        self.last_run = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='job-reaper')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"❌ Reaper run failed: {e}")
+
+    def reap(self):
+        now = time.time()
+        jobs_evicted = outputs_evicted = bytes_reclaimed = 0
+
+        # 1. Jobs past the TTL for their state
+        for job in jobs.all():
+            ttl = JOB_TTLS.get(job['status'])
+            if ttl is None or now - job['updated'] < ttl:
+                continue
+            if job.get('output_file'):
+                bytes_reclaimed += remove_file(job['output_file'])
+            bytes_reclaimed += remove_file(trace_path(job['id']))
+            jobs.delete(job['id'])
+            jobs_evicted += 1
+
+        # 2. Oldest completed outputs while over quota or short on disk
+        completed = sorted((job for job in jobs.all() if job['status'] == 'completed' and job.get('output_file')),
+                           key=lambda job: job['updated'])
+        output_bytes = sum(job.get('output_size', 0) for job in completed)
+        for job in completed:
+            free_bytes = shutil.disk_usage(os.path.dirname(job['output_file'])).free
+            if output_bytes <= OUTPUT_QUOTA_BYTES and free_bytes >= MIN_FREE_DISK_BYTES:
+                break
+            reclaimed = remove_file(job['output_file'])
+            output_bytes -= job.get('output_size', 0)
+            bytes_reclaimed += reclaimed
+            outputs_evicted += 1
+            update_job(job['id'], status='expired', output_file=None,
+                       message='Result expired, please convert the file again')
+
+        prune_upload_sessions()
+        prune_batches()
+
+        with self._lock:
+            self.runs += 1
+            self.jobs_evicted += jobs_evicted
+            self.outputs_evicted += outputs_evicted
+            self.bytes_reclaimed += bytes_reclaimed
+            self.last_run = now
+
+        if jobs_evicted or outputs_evicted:
+            logger.info(f"🧹 Reaper evicted {jobs_evicted} jobs and {outputs_evicted} outputs, "
+                        f"reclaimed {bytes_reclaimed} bytes")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'jobs_evicted': self.jobs_evicted,
+                'outputs_evicted': self.outputs_evicted,
+                'bytes_reclaimed': self.bytes_reclaimed,
+                'last_run': self.last_run
+            }
+
+
+reaper = JobReaper(REAPER_INTERVAL_SECONDS)
+
+
+def notify_job_update():
+    """Wake up event streams so they re-check the jobs they follow"""
+    global job_updates_version
+    with job_updates:
+        job_updates_version += 1
+        job_updates.notify_all()
+
+
+def update_job(job_id, **fields):
+    """Update a job's fields and notify event streams"""
+    jobs.update(job_id, **fields)
+    notify_job_update()
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another upload"""
+
+    def __init__(self, retry_after):
+        super().__init__('Server is busy, please retry later')
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """Fixed-size pool of worker threads that claim queued jobs from the job store.
+
+    With a shared job store every worker process runs its own pool, and each
+    queued job is claimed by exactly one of them. One more thread only claims
+    small jobs; the page scheduler gives their pages precedence, so they finish
+    quickly even while every other worker is busy with a large document.
+    """
+
+    def __init__(self, workers, max_queued, handler):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.handler = handler
+        self._cond = threading.Condition()
+        self._threads = []
+        self._active = 0
+        self._durations = collections.deque(maxlen=50)
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'ocr-worker-{i}')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            if SMALL_JOB_PAGES:
+                thread = threading.Thread(target=self._run, args=(SMALL_JOB_PAGES,), name='ocr-worker-small')
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"👷 Started {self.workers} OCR workers (queue size {self.max_queued}, {jobs.name} job store)")
+
+    def submit(self, job):
+        """Queue a job, raising QueueFullError if the queue is at capacity"""
+        self.submit_many([job])
+
+    def check_capacity(self, count=1):
+        """Raise QueueFullError unless the queue has room for this many more uploads.
+
+        A batch takes a single place however many jobs it has; MAX_BATCH_FILES
+        bounds its size instead.
+        """
+        if jobs.queue_entries() + count > self.max_queued:
+            raise QueueFullError(self._retry_after())
+
+    def submit_many(self, new_jobs):
+        """Queue several jobs back to back so their pages share the pool; admitted together or not at all"""
+        self.start()
+        self.check_capacity(len({job.get('batch_id') or job['id'] for job in new_jobs}))
+        for job in new_jobs:
+            jobs.enqueue(job)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self, max_pages=None):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{PROCESS_TOKEN}:{threading.current_thread().name}"
+        while True:
+            job = jobs.claim(worker_id, max_pages)
+            if job is None:
+                # Woken by local submissions; the timeout picks up jobs queued by other processes
+                with self._cond:
+                    self._cond.wait(timeout=STORE_POLL_SECONDS)
+                continue
+
+            # Queue positions of everyone still waiting just moved up
+            notify_job_update()
+
+            with self._cond:
+                self._active += 1
+            started = time.time()
+            try:
+                self.handler(job['id'], job['input_file'], job['filename'])
+            except Exception as e:
+                logger.error(f"❌ Worker crashed on job {job['id']}: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._durations.append(time.time() - started)
+
+    def average_duration(self):
+        with self._cond:
+            if not self._durations:
+                return DEFAULT_JOB_SECONDS
+            return sum(self._durations) / len(self._durations)
+
+    def position(self, job_id):
+        """1-based position of a job in the queue, or None once it has started"""
+        return jobs.queue_position(job_id)
+
+    def eta(self, job):
+        """Estimated seconds until a job finishes"""
+        average = self.average_duration()
+        if job['status'] == 'queued':
+            position = self.position(job['id'])
+            if position is None:
+                return None
+            # Wait for the jobs ahead of us to drain, then run our own
+            waves = math.ceil(position / self.workers)
+            return round(waves * average + average)
+        if job['status'] == 'processing':
+            elapsed = time.time() - job.get('processing_started', job['start_time'])
+            progress = job.get('progress', 0)
+            if progress > 10:
+                return round(max(0, elapsed * (100 - progress) / progress))
+            return round(max(0, average - elapsed))
+        return None
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.average_duration() / self.workers))
+
+    def stats(self):
+        with self._cond:
+            active = self._active
+        return {
+            'workers': self.workers,
+            'active': active,
+            'queued': jobs.queue_depth(),
+            'capacity': self.max_queued
+        }
+
+
+scheduler = JobScheduler(JOB_WORKERS, JOB_QUEUE_SIZE, process_pdf_background)
+
+
+def page_pool_memory_bytes():
+    pool = _page_pool
+    if pool is None:
+        return 0
+    sizes = [resident_memory_bytes(pid) for pid in list(getattr(pool, '_processes', None) or {})]
+    return sum(size for size in sizes if size is not None)
+
+
+metrics.gauge('ocr_queue_depth', 'Jobs waiting in the queue', jobs.queue_depth)
+metrics.gauge('ocr_active_workers', 'Worker threads currently processing a job',
+              lambda: scheduler.stats()['active'])
+metrics.gauge('ocr_workers', 'Worker threads in this process', lambda: scheduler.workers)
+metrics.gauge('ocr_memory_reserved_bytes', 'Estimated memory of the pages in flight, against OCR_MEMORY_BUDGET_MB',
+              lambda: page_scheduler.memory_reserved)
+metrics.gauge('ocr_pages_waiting', 'Pages of running jobs waiting for a slot in the page pool',
+              page_scheduler.backlog)
+metrics.gauge('ocr_temp_disk_bytes', 'Bytes of working files on disk, by area', lambda: {
+    'uploads': directory_bytes(UPLOAD_DIR),
+    'outputs': directory_bytes(OUTPUT_DIR),
+    'checkpoints': directory_bytes(JOBS_DIR),
+    'result_cache': directory_bytes(RESULT_CACHE_DIR),
+    'page_cache': directory_bytes(PAGE_CACHE_DIR),
+    'traces': directory_bytes(TRACE_DIR)
+}, label='area')
+metrics.gauge('ocr_resident_memory_bytes', 'Resident memory of this server process and its page pool', lambda: {
+    'server': resident_memory_bytes(),
+    'page_pool': page_pool_memory_bytes()
+}, label='process')
+
+
+def worker_alive(worker_id):
+    """Whether the process behind a worker id might still be running"""
+    try:
+        host, pid, token, _ = worker_id.split(':', 3)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return True  # can't check processes on other nodes
+    if pid == os.getpid():
+        return token == PROCESS_TOKEN
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_interrupted_jobs():
+    """Re-queue jobs whose worker died (deploy, crash, OOM kill) so they resume from their checkpoints"""
+    with open(os.path.join(WORK_DIR, 'recovery.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # another worker process is already recovering
+
+        recovered = 0
+        for entry in os.scandir(JOBS_DIR):
+            try:
+                with open(os.path.join(entry.path, 'job.json')) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if not os.path.exists(job.get('input_file') or ''):
+                remove_job_checkpoint(entry.name)
+                continue
+
+            current = jobs.get(job['id'])
+            if current is not None:
+                if current['status'] in ('completed', 'failed', 'expired'):
+                    remove_job_checkpoint(entry.name)
+                    continue
+                if current['status'] == 'queued':
+                    continue
+                if current['status'] == 'processing' and worker_alive(current.get('worker')):
+                    continue
+                job = current
+
+            job.update(progress=0, message='Resuming after restart...')
+            jobs.enqueue(job)
+            recovered += 1
+
+        if recovered:
+            logger.info(f"♻️ Re-queued {recovered} interrupted jobs")
+            scheduler.start()
+
+
+_services_started = False
+_services_lock = threading.Lock()
+
+@app.before_request
+def start_background_services():
+    """Start this process's background work: the OCR workers, the reaper and recovery of interrupted jobs.
+
+    Servers that import the app start it straight away (see the end of this
+    module), so a worker process that never receives an upload still claims
+    jobs queued in a shared store; otherwise it starts with the first request.
+    It never runs in page pool processes (which import this module too) or a
+    reloader's watcher process.
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+
+    log_engine()
+    scheduler.start()
+    reaper.start()
+    if OCR_RECOVER_JOBS:
+        recover_interrupted_jobs()
+
+
+@app.after_request
+def count_request(response):
+    http_requests_total.inc(endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+
+@app.route('/')
+def home():
+    return render_template_string(HTML_TEMPLATE, max_upload_mb=MAX_UPLOAD_BYTES // (1024 * 1024))
+
+def parse_job_options(form):
+    """Validate the OCR options sent along with an upload"""
+    language = form.get('language', OCR_LANGUAGE)
+    if not LANGUAGE_PATTERN.match(language):
+        raise InvalidUploadError('Invalid language')
+
+    try:
+        jpeg_quality = int(form.get('jpeg_quality') or OCR_JPEG_QUALITY)
+    except (TypeError, ValueError):
+        jpeg_quality = -1
+    if not 0 <= jpeg_quality <= 95:
+        raise InvalidUploadError('Invalid JPEG quality (1-95, or 0 to keep images as they are)')
+
+    priority = form.get('priority') or DEFAULT_PRIORITY
+    if priority not in PRIORITY_WEIGHTS:
+        raise InvalidUploadError(f"Invalid priority ({', '.join(PRIORITY_WEIGHTS)})")
+
+    return {
+        'language': language,
+        'force_ocr': form.get('force_ocr', '').lower() in ('1', 'true', 'on', 'yes'),
+        'jpeg_quality': jpeg_quality,
+        'priority': priority,
+        'trace': form.get('trace', '').lower() in ('1', 'true', 'on', 'yes')
+    }
+
+def create_job(input_file, filename, content_hash, options, batch_id=None):
+    """Build the job for a saved upload, completing it straight from the result cache when possible.
+
+    Cache hits are stored as completed jobs; anything else is returned with
+    status 'queued' for the caller to hand to the scheduler.
+    """
+    job_id = str(uuid.uuid4())
+    cache_key = result_cache_key(content_hash, options['language'], options['force_ocr'], options['jpeg_quality'])
+    reaper.start()
+
+    job = {
+        'id': job_id,
+        'status': 'queued',
+        'progress': 0,
+        'message': 'Waiting in queue...',
+        'filename': filename,
+        'input_file': input_file,
+        'language': options['language'],
+        'force_ocr': options['force_ocr'],
+        'jpeg_quality': options['jpeg_quality'],
+        'priority': options['priority'],
+        'trace': options['trace'],
+        'content_hash': content_hash,
+        'cache_key': cache_key,
+        'start_time': time.time()
+    }
+    if batch_id:
+        job['batch_id'] = batch_id
+
+    # Identical upload with identical settings: reuse the earlier output
+    output_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=OUTPUT_DIR)
+    output_temp.close()
+    if result_cache.get(cache_key, output_temp.name):
+        os.unlink(input_file)
+        page_count = count_pages(output_temp.name)
+        job.update(
+            status='completed',
+            progress=100,
+            message='Conversion completed successfully! (cached result)',
+            input_file=None,
+            output_file=output_temp.name,
+            output_size=os.path.getsize(output_temp.name),
+            pages_processed=page_count,
+            pages_total=page_count,
+            pages_ready=page_count,
+            processing_time=time.time() - job['start_time'],
+            cached=True
+        )
+        jobs.create(job)
+        logger.info(f"♻️ Cache hit for job {job_id} ({filename})")
+        return job
+    os.unlink(output_temp.name)
+
+    # Fail fast on inputs the workers could only reject after waiting in the queue
+    try:
+        probe = sniff_input(input_file)
+    except InvalidUploadError:
+        os.unlink(input_file)
+        raise
+    job.update(input_kind=probe['kind'], pages_total=probe['pages'])
+    return job
+
+def queue_full_response(error):
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def start_job(input_file, filename, content_hash, options):
+    """Create a job for a saved upload: serve it from the result cache or queue it.
+
+    Raises QueueFullError with the input file left in place, for the caller
+    to delete or keep for a retry.
+    """
+    job = create_job(input_file, filename, content_hash, options)
+    job_id = job['id']
+    if job['status'] == 'completed':
+        return jsonify({
+            'job_id': job_id,
+            'status': 'completed',
+            'message': 'Served from cache'
+        })
+
+    # Hand the job to the worker pool
+    write_job_checkpoint(job)
+    try:
+        scheduler.submit(job)
+    except QueueFullError:
+        remove_job_checkpoint(job_id)
+        raise
+
+    logger.info(f"🚀 Queued job {job_id} for file: {filename}")
+
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'message': 'Job queued',
+        'queue_position': scheduler.position(job_id)
+    })
+
+@app.route('/start-conversion', methods=['POST'])
+def start_conversion():
+    upload_started = time.perf_counter()
+    # Turn uploads away before reading them when the queue is already full
+    # (start_job checks again, as other uploads may have filled it meanwhile)
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        logger.warning("🚦 Queue full, rejected upload before reading it")
+        return queue_full_response(e)
+
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file uploaded'}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        options = parse_job_options(request.form)
+
+        # Save file, validating and hashing it on the way to disk
+        input_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=UPLOAD_DIR)
+        input_temp.close()
+        try:
+            content_hash = save_upload(file.stream, input_temp.name)
+        except Exception:
+            os.unlink(input_temp.name)
+            raise
+        upload_seconds.observe(time.perf_counter() - upload_started)
+
+        try:
+            return start_job(input_temp.name, file.filename, content_hash, options)
+        except QueueFullError as e:
+            os.unlink(input_temp.name)
+            logger.warning(f"🚦 Queue full, rejected upload: {file.filename}")
+            return queue_full_response(e)
+
+    except InvalidUploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        logger.error(f"❌ Failed to start conversion: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/start-batch', methods=['POST'])
+def start_batch():
+    """Queue a job for each uploaded document, and for each document inside uploaded ZIP archives.
+
+    Files can be sent in the request, or first as chunked uploads (for
+    batches too big for one request) whose ids are listed in upload_ids.
+    """
+    upload_started = time.perf_counter()
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        logger.warning("🚦 Queue full, rejected batch before reading it")
+        return queue_full_response(e)
+
+    params = request.get_json(silent=True) or request.form
+    upload_ids = params.get('upload_ids') if request.is_json else request.form.getlist('upload_ids')
+    files = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename]
+    if not files and not upload_ids:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        options = parse_job_options(params)
+    except InvalidUploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    batch_id = uuid.uuid4().hex
+    batch_jobs = []
+    rejected = []
+    sessions = []
+    for upload_id in upload_ids or []:
+        session = get_upload_session(str(upload_id))
+        if session is None:
+            rejected.append({'filename': upload_id, 'error': 'Upload not found'})
+        elif not session['received'] or (session['size'] and session['received'] != session['size']):
+            rejected.append({'filename': session['filename'], 'error': 'Upload incomplete'})
+        else:
+            sessions.append((session, open(_upload_paths(session['id'])[1], 'rb')))
+            files.append(werkzeug.datastructures.FileStorage(sessions[-1][1], filename=session['filename']))
+    try:
+        # Count from the ZIP directories, before anything is unpacked
+        documents = count_batch_documents(files)
+        if documents > MAX_BATCH_FILES:
+            return jsonify({'error': f'Batch has {documents} documents; the limit is {MAX_BATCH_FILES}',
+                            'rejected': rejected}), 400
+
+        for filename, stream, error in batch_uploads(files):
+            if error is not None:
+                rejected.append({'filename': filename, 'error': error})
+                continue
+
+            input_temp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf', dir=UPLOAD_DIR)
+            input_temp.close()
+            try:
+                content_hash = save_upload(stream, input_temp.name)
+            except (InvalidUploadError, zipfile.BadZipFile) as e:
+                os.unlink(input_temp.name)
+                rejected.append({'filename': filename, 'error': str(e)})
+                continue
+            try:
+                batch_jobs.append(create_job(input_temp.name, filename, content_hash, options, batch_id))
+            except InvalidUploadError as e:
+                rejected.append({'filename': filename, 'error': str(e)})
+
+        if not batch_jobs:
+            return jsonify({'error': 'No valid documents in batch', 'rejected': rejected}), 400
+        upload_seconds.observe(time.perf_counter() - upload_started)
+
+        # Queue the whole batch back to back; workers then feed all of its pages to the shared pool
+        pending = [job for job in batch_jobs if job['status'] == 'queued']
+        for job in pending:
+            write_job_checkpoint(job)
+        scheduler.submit_many(pending)
+
+    except Exception as e:
+        for job in batch_jobs:
+            if job['status'] == 'queued':
+                remove_job_checkpoint(job['id'])
+                remove_file(job['input_file'])
+            else:
+                jobs.delete(job['id'])
+                remove_file(job['output_file'])
+
+        if isinstance(e, QueueFullError):
+            logger.warning(f"🚦 Queue full, rejected batch of {len(batch_jobs)} files")
+            return queue_full_response(e)
+        logger.error(f"❌ Failed to start batch: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        for _, stream in sessions:
+            stream.close()
+
+    # The uploads are copied into the jobs; keep them only if the batch was turned away
+    for session, _ in sessions:
+        discard_upload_session(session['id'])
+
+    save_batch({
+        'id': batch_id,
+        'created': time.time(),
+        'job_ids': [job['id'] for job in batch_jobs],
+        'rejected': rejected
+    })
+    logger.info(f"📦 Queued batch {batch_id}: {len(pending)} jobs, "
+                f"{len(batch_jobs) - len(pending)} cached, {len(rejected)} rejected")
+
+    return jsonify({
+        'batch_id': batch_id,
+        'job_ids': [job['id'] for job in batch_jobs],
+        'rejected': rejected,
+        'message': f'Batch of {len(batch_jobs)} files queued'
+    })
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked upload. Chunks are then PUT to /uploads/<upload_id>?offset=N."""
+    params = request.get_json(silent=True) or request.form
+    filename = params.get('filename', '')
+    if not filename:
+        return jsonify({'error': 'No file selected'}), 400
+
+    try:
+        size = int(params.get('size', 0)) or None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        return jsonify({'error': f'File too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)}MB)'}), 413
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    prune_upload_sessions()
+
+    now = time.time()
+    session = {
+        'id': uuid.uuid4().hex,
+        'filename': filename,
+        'size': size,
+        'received': 0,
+        'created': now,
+        'updated': now,
+        'hasher': hashlib.sha256(),
+        'lock': threading.Lock()
+    }
+    open(_upload_paths(session['id'])[1], 'wb').close()
+    _save_upload_session(session)
+    with uploads_lock:
+        uploads[session['id']] = session
+
+    logger.info(f"📤 Started chunked upload {session['id']} for {filename}")
+    return jsonify({'upload_id': session['id'], 'offset': 0, 'chunk_size': CLIENT_CHUNK_BYTES})
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """How much of an upload has arrived, so a client can resume after a dropped connection"""
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    return jsonify({'upload_id': upload_id, 'offset': session['received'], 'size': session['size']})
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append one chunk. The offset must match what the server already has."""
+    upload_started = time.perf_counter()
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    with session['lock']:
+        offset = request.args.get('offset', type=int)
+        if offset != session['received']:
+            # Client is out of sync (e.g. a retried chunk); tell it where to continue
+            return jsonify({'error': 'Offset mismatch', 'offset': session['received']}), 409
+
+        _, data_path = _upload_paths(upload_id)
+        hasher = session['hasher'].copy() if session['hasher'] is not None else None
+        received = session['received']
+        try:
+            with open(data_path, 'r+b') as out:
+                out.seek(received)
+                while True:
+                    chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if received == 0:
+                        # ZIP archives are only useful in a batch, which checks their contents
+                        check_header(chunk, allow_zip=True)
+                    received += len(chunk)
+                    if received > MAX_UPLOAD_BYTES or (session['size'] and received > session['size']):
+                        raise InvalidUploadError('Upload is larger than declared')
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    out.write(chunk)
+                # Drop anything past the committed offset left by an earlier failed chunk
+                out.truncate(received)
+        except InvalidUploadError as e:
+            logger.warning(f"🚫 Rejected upload {upload_id}: {e}")
+            discard_upload_session(upload_id)
+            return jsonify({'error': str(e)}), 400
+
+        session.update(received=received, hasher=hasher, updated=time.time())
+        _save_upload_session(session)
+    upload_seconds.observe(time.perf_counter() - upload_started)
+
+    return jsonify({'upload_id': upload_id, 'offset': received})
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Turn a complete upload into an OCR job"""
+    session = get_upload_session(upload_id)
+    if session is None:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    try:
+        options = parse_job_options(request.get_json(silent=True) or request.form)
+    except InvalidUploadError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with session['lock']:
+        if session['received'] == 0:
+            return jsonify({'error': 'Input file is empty'}), 400
+        if session['size'] and session['received'] != session['size']:
+            return jsonify({'error': 'Upload incomplete', 'offset': session['received']}), 409
+
+        # The upload stays resumable until its job is admitted, so a finalize
+        # turned away by a full queue can simply be retried
+        try:
+            scheduler.check_capacity()
+        except QueueFullError as e:
+            logger.warning(f"🚦 Queue full, kept upload {upload_id} for a retry")
+            return queue_full_response(e)
+
+        _, data_path = _upload_paths(upload_id)
+        input_file = os.path.join(UPLOAD_DIR, f"{upload_id}.pdf")
+        os.replace(data_path, input_file)
+        try:
+            content_hash = session['hasher'].hexdigest() if session['hasher'] is not None else file_sha256(input_file)
+            response = start_job(input_file, session['filename'], content_hash, options)
+        except QueueFullError as e:
+            os.replace(input_file, data_path)
+            logger.warning(f"🚦 Queue full, kept upload {upload_id} for a retry")
+            return queue_full_response(e)
+        except InvalidUploadError as e:
+            discard_upload_session(upload_id)
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            remove_file(input_file)
+            discard_upload_session(upload_id)
+            logger.error(f"❌ Failed to start conversion: {e}")
+            return jsonify({'error': str(e)}), 500
+
+        discard_upload_session(upload_id)
+        return response
+
+def job_status_payload(job):
+    """Public view of a job, as returned by /job-status and /job-events"""
+    message = job.get('message', 'Processing...')
+    queue_position = scheduler.position(job['id']) if job['status'] == 'queued' else None
+    if queue_position:
+        message = f'Waiting in queue (position {queue_position})...'
+
+    return {
+        'status': job['status'],
+        'progress': job.get('progress', 0),
+        'message': message,
+        'error': job.get('error'),
+        'filename': job.get('filename'),
+        'pages_processed': job.get('pages_processed'),
+        'processing_time': job.get('processing_time'),
+        'queue_position': queue_position,
+        'eta_seconds': scheduler.eta(job),
+        'cached': job.get('cached', False),
+        'pages_reused': job.get('pages_reused'),
+        'pages_skipped': job.get('pages_skipped'),
+        'pages_resumed': job.get('pages_resumed'),
+        'page_types': job.get('page_types'),
+        'page_dpi': job.get('page_dpi'),
+        'strategy': job.get('strategy'),
+        'priority': job.get('priority', DEFAULT_PRIORITY),
+        'output_size': job.get('output_size'),
+        'estimated_bytes_saved': job.get('estimated_bytes_saved'),
+        'pages_total': job.get('pages_total'),
+        'pages_ready': job.get('pages_ready', 0),
+        'batch_id': job.get('batch_id')
+    }
+
+@app.route('/job-status/<job_id>')
+def get_job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return conditional_json(job_status_payload(job), clock_fields=('eta_seconds',))
+
+@app.route('/job-events/<job_id>')
+def job_events(job_id):
+    """Server-Sent Events stream that pushes job status whenever it changes"""
+    if job_id not in jobs:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # Updates made by other worker processes don't wake us, so poll a shared store
+    wait_seconds = STORE_POLL_SECONDS if jobs.shared else SSE_HEARTBEAT_SECONDS
+
+    def stream():
+        yield 'retry: 2000\n\n'
+        last_sent = None
+        last_write = time.time()
+        deadline = time.time() + SSE_MAX_STREAM_SECONDS
+
+        while True:
+            with job_updates:
+                seen_version = job_updates_version
+
+            job = jobs.get(job_id)
+            if job is None:
+                yield 'event: gone\ndata: {}\n\n'
+                return
+
+            payload = job_status_payload(job)
+            # ETA drifts every second; only real progress is worth an event
+            changes = (payload['status'], payload['progress'], payload['message'])
+            if changes != last_sent:
+                last_sent = changes
+                last_write = time.time()
+                yield f"data: {json.dumps(payload)}\n\n"
+
+            if payload['status'] in ('completed', 'failed', 'expired') or time.time() > deadline:
+                return
+
+            with job_updates:
+                job_updates.wait_for(lambda: job_updates_version != seen_version, timeout=wait_seconds)
+            if time.time() - last_write >= SSE_HEARTBEAT_SECONDS:
+                last_write = time.time()
+                yield ': keep-alive\n\n'
+
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def download_name(filename):
+    """Name for a job's output, based on the uploaded file's name"""
+    safe_filename = "".join(c for c in filename if c.isalnum() or c in (' ', '-', '_', '.')).strip()
+    return f"{os.path.splitext(safe_filename)[0]}_OCR.pdf"
+
+@app.route('/download/<job_id>')
+def download_result(job_id):
+    """The finished PDF; with ?partial=1, the pages finished so far while the job still runs"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job['status'] == 'expired':
+        return jsonify({'error': job['message']}), 410
+
+    if job['status'] in ('queued', 'processing') and request.args.get('partial') in ('1', 'true'):
+        return download_partial(job)
+
+    if job['status'] != 'completed':
+        return jsonify({'error': 'Job not completed'}), 400
+
+    if not job.get('output_file') or not os.path.exists(job['output_file']):
+        return jsonify({'error': 'Output file not found'}), 404
+
+    try:
+        return send_output(job['output_file'], download_name(job['filename']))
+
+    except werkzeug.exceptions.HTTPException:
+        raise  # e.g. 416 for a range past the end of the file
+
+    except Exception as e:
+        logger.error(f"❌ Download failed for job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def conditional_json(payload, clock_fields=()):
+    """JSON with an ETag, so pollers whose copy is still current get a bodiless 304.
+
+    clock_fields (ETAs, rates) drift with every second that passes, so they're
+    left out of the ETag; it changes only when the state itself does.
+    """
+    response = jsonify(payload)
+    state = {key: value for key, value in payload.items() if key not in clock_fields}
+    response.set_etag(hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest())
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def send_output(path, filename):
+    """Send a finished file, or hand the transfer to the front-end server (OCR_SENDFILE)"""
+    if OCR_SENDFILE not in ('x-sendfile', 'x-accel'):
+        # send_file answers Range, If-Range and If-None-Match itself
+        response = send_file(path, as_attachment=True, download_name=filename, mimetype='application/pdf')
+        response.accept_ranges = 'bytes'
+        return response
+
+    response = werkzeug.utils.send_file(
+        path, request.environ,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/pdf',
+        use_x_sendfile=True,
+        conditional=False,
+        response_class=app.response_class
+    )
+    if OCR_SENDFILE == 'x-accel':
+        relative_path = os.path.relpath(os.path.realpath(path), os.path.realpath(WORK_DIR))
+        response.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path
+        del response.headers['X-Sendfile']
+    # Byte ranges are left to the front-end server, which has the file
+    return response.make_conditional(request)
+
+def download_partial(job):
+    pages_ready = job.get('pages_ready', 0)
+    if pages_ready:
+        try:
+            # Opened before responding, so a refresh replacing the file can't race the download
+            partial = open(partial_output_path(job['id']), 'rb')
+        except FileNotFoundError:
+            pages_ready = 0
+    if not pages_ready:
+        response = jsonify({'error': 'No pages are ready yet', 'pages_ready': 0})
+        response.headers['Retry-After'] = str(max(1, math.ceil(PARTIAL_RESULT_SECONDS)))
+        return response, 409
+
+    stem = os.path.splitext(download_name(job['filename']))[0]
+    stat = os.fstat(partial.fileno())
+    response = send_file(
+        partial,
+        as_attachment=True,
+        download_name=f"{stem}_pages_1-{pages_ready}.pdf",
+        mimetype='application/pdf',
+        conditional=False,
+        etag=f"{job['id']}-{stat.st_mtime_ns}-{stat.st_size}"
+    )
+    response.content_length = stat.st_size
+    response = response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+    response.headers['X-Pages-Ready'] = str(pages_ready)
+    response.headers['X-Pages-Total'] = str(job.get('pages_total', ''))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/job-page/<job_id>/<int:page_number>')
+def download_page(job_id, page_number):
+    """A single OCR'd page (1-based), as soon as that page is done"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job['status'] == 'expired':
+        return jsonify({'error': job['message']}), 410
+
+    pages_total = job.get('pages_total') or job.get('pages_processed')
+    if job['status'] == 'failed' or (pages_total and not 1 <= page_number <= pages_total):
+        return jsonify({'error': 'Page not found'}), 404
+
+    page_index = page_number - 1
+    if page_index in job.get('failed_pages', []):
+        return jsonify({'error': 'OCR failed for this page'}), 404
+
+    stem = os.path.splitext(download_name(job['filename']))[0]
+    page_filename = f"{stem}_page_{page_number}.pdf"
+    page_types = job.get('page_types') or []
+    source = None
+    if job['status'] == 'completed':
+        source = (job.get('output_file'), output_page_index(job, page_index))
+    elif os.path.exists(checkpoint_page_path(job_id, page_index)):
+        return send_file(checkpoint_page_path(job_id, page_index), as_attachment=True,
+                         download_name=page_filename, mimetype='application/pdf')
+    elif page_index < job.get('pages_ready', 0):
+        source = (partial_output_path(job_id), output_page_index(job, page_index))
+    elif page_index < len(page_types) and page_types[page_index] == 'text' and not job.get('force_ocr'):
+        # Kept unchanged in the output, so the upload itself has it
+        source = (job.get('input_file'), page_index)
+
+    if source is None:
+        response = jsonify({'error': 'Page not ready yet'})
+        response.headers['Retry-After'] = '2'
+        return response, 409
+
+    try:
+        data = extract_page(*source)
+    except (OSError, TypeError, IndexError) as e:
+        # The job moved on (finished, or its files expired) while we were looking
+        logger.warning(f"⚠️ Could not extract page {page_number} of job {job_id}: {e}")
+        return jsonify({'error': 'Page not available, please retry'}), 409
+
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=page_filename, mimetype='application/pdf',
+                     etag=hashlib.sha1(data).hexdigest())
+
+def batch_status_payload(batch):
+    """Aggregate progress and throughput over a batch's jobs"""
+    counts = collections.Counter()
+    children = []
+    progress = pages_total = pages_done = 0
+    now = time.time()
+
+    for job_id in batch['job_ids']:
+        job = jobs.get(job_id)
+        if job is None:
+            # Reaped after its TTL
+            job = {'id': job_id, 'status': 'expired', 'progress': 0}
+        counts[job['status']] += 1
+        progress += 100 if job['status'] in ('completed', 'failed', 'expired') else job.get('progress', 0)
+        pages_total += job.get('pages_total') or 0
+        if job['status'] == 'completed':
+            pages_done += job.get('pages_processed') or 0
+        else:
+            pages_done += job.get('pages_done', 0)
+        children.append({
+            'job_id': job_id,
+            'filename': job.get('filename'),
+            'status': job['status'],
+            'progress': job.get('progress', 0),
+            'error': job.get('error')
+        })
+
+    progress /= len(batch['job_ids'])
+    pending = counts['queued'] + counts['processing']
+    if not pending:
+        status = 'completed'
+        finished = max((jobs.get(job_id) or {}).get('updated', now) for job_id in batch['job_ids'])
+        elapsed = max(0, finished - batch['created'])
+    else:
+        status = 'processing' if counts['processing'] or counts['completed'] else 'queued'
+        elapsed = now - batch['created']
+
+    eta = None
+    if pending and progress > 0:
+        eta = round(max(0, elapsed * (100 - progress) / progress))
+
+    return {
+        'batch_id': batch['id'],
+        'status': status,
+        'progress': int(progress),
+        'jobs_total': len(batch['job_ids']),
+        'jobs_queued': counts['queued'],
+        'jobs_processing': counts['processing'],
+        'jobs_completed': counts['completed'],
+        'jobs_failed': counts['failed'],
+        'jobs_expired': counts['expired'],
+        'pages_total': pages_total,
+        'pages_done': pages_done,
+        'pages_per_second': round(pages_done / elapsed, 2) if elapsed > 0 else None,
+        'elapsed_seconds': round(elapsed, 1),
+        'eta_seconds': eta,
+        'rejected': batch['rejected'],
+        'jobs': children
+    }
+
+@app.route('/batch-status/<batch_id>')
+def get_batch_status(batch_id):
+    batch = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    return conditional_json(batch_status_payload(batch),
+                            clock_fields=('eta_seconds', 'pages_per_second', 'elapsed_seconds'))
+
+@app.route('/batch-download/<batch_id>')
+def download_batch(batch_id):
+    """Stream every finished output of a batch as one ZIP archive"""
+    batch = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    batch_jobs = [job for job in map(jobs.get, batch['job_ids']) if job is not None]
+    if any(job['status'] in ('queued', 'processing') for job in batch_jobs):
+        return jsonify({'error': 'Batch not completed'}), 400
+
+    entries = []
+    names = set()
+    for job in batch_jobs:
+        if job['status'] != 'completed' or not job.get('output_file'):
+            continue
+        # Two uploads with the same name get numbered entries
+        name = download_name(job['filename'])
+        stem, ext = os.path.splitext(name)
+        counter = 1
+        while name in names:
+            counter += 1
+            name = f"{stem}_{counter}{ext}"
+        names.add(name)
+        entries.append((name, job['output_file']))
+
+    if not entries:
+        return jsonify({'error': 'No completed outputs in batch'}), 404
+
+    def stream():
+        sink = ZipStream()
+        # PDFs are already compressed; storing them keeps this cheap
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+            for name, path in entries:
+                try:
+                    src = open(path, 'rb')
+                except FileNotFoundError:
+                    logger.warning(f"⚠️ Output for {name} expired during batch download")
+                    continue
+                with src, archive.open(zipfile.ZipInfo.from_file(path, name), 'w') as dest:
+                    while True:
+                        chunk = src.read(UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield sink.take()
+                yield sink.take()
+        yield sink.take()
+
+    response = app.response_class(stream(), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="batch_{batch_id[:8]}_OCR.zip"'
+    return response
+
+@app.route('/job-trace/<job_id>')
+def download_trace(job_id):
+    """Chrome trace-event JSON for a traced job, for chrome://tracing or Perfetto"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job['status'] in ('queued', 'processing'):
+        return jsonify({'error': 'Job not finished'}), 400
+
+    path = trace_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'No trace was recorded for this job (upload it with trace=1)'}), 404
+
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=f"{os.path.splitext(download_name(job['filename']))[0]}_trace.json",
+        mimetype='application/json'
+    )
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/test')
+def test():
+    try:
+        result = subprocess.run(['tesseract', '--version'], 
+                              capture_output=True, text=True, timeout=5)
+        tesseract_version = result.stdout.split('\n')[0] if result.returncode == 0 else "Not found"
+    except:
+        tesseract_version = "Error checking"
+
+    return jsonify({
+        'status': 'working',
+        'flask': 'OK',
+        'tesseract': tesseract_version,
+        'active_jobs': len(jobs),
+        'polling_system': 'enabled',
+        'event_stream': 'enabled',
+        'job_store': jobs.name,
+        'scheduler': scheduler.stats(),
+        'ocr_engine': engine_version(),
+        'result_cache': result_cache.stats(),
+        'page_cache': page_cache.stats(),
+        'reaper': reaper.stats()
+    })
+
+# Imported by a server (gunicorn main:app and the like): start working now.
+# Page pool processes import this module too and leave it to their server.
+if __name__ != '__main__' and os.environ.get('OCR_PAGE_POOL_PARENT') != str(os.getppid()):
+    start_background_services()
+
+if __name__ == '__main__':
+    logger.info("🚀 Starting OCR PDF Converter with Polling System")
+
+    # Test dependencies
+    try:
+        result = subprocess.run(['tesseract', '--version'], capture_output=True, text=True, timeout=5)
+        if result.returncode == 0:
+            version = result.stdout.split('\n')[0]
+            logger.info(f"✅ Tesseract found: {version}")
+        else:
+            logger.warning("⚠️ Tesseract not responding properly")
+    except:
+        logger.warning("⚠️ Could not verify Tesseract installation")
+
+    # Resume interrupted jobs right away rather than on the first request
+    # (WERKZEUG_RUN_MAIN marks the reloader's serving process)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
 
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def main(tmp_path_factory):
+    """The app module, imported against a scratch work dir (it reads its settings at import time)"""
+    os.environ['OCR_WORK_DIR'] = str(tmp_path_factory.mktemp('work'))
+    os.environ.setdefault('OCR_JOB_WORKERS', '1')
+    os.environ.setdefault('OCR_PAGE_PROCESSES', '1')
+    os.environ.setdefault('OCR_ENGINE', 'subprocess')
+    import main
+    yield main
+    main.reset_page_pool()
+
+
+@pytest.fixture
+def skip_ocr(main, monkeypatch):
+    """Let the workers claim queued jobs without running them; yields the ids of the jobs claimed"""
+    claimed = []
+    monkeypatch.setattr(main.scheduler, 'handler', lambda job_id, input_file, filename: claimed.append(job_id))
+    yield claimed
+    deadline = time.time() + 10
+    while main.jobs.queue_depth() and time.time() < deadline:
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def client(main, skip_ocr):
+    return main.app.test_client()
@@ -0,0 +1,84 @@
+import io
+import os
+import zipfile
+
+import pikepdf
+
+
+def pdf_bytes(pages=1):
+    pdf = pikepdf.Pdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page(page_size=(200, 200))
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+def zip_bytes(count):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for i in range(count):
+            archive.writestr(f'docs/doc-{i}.pdf', pdf_bytes())
+        archive.writestr('docs/.DS_Store', b'')
+    return buffer.getvalue()
+
+
+def post_batch(client, *files, **fields):
+    data = dict(fields, files=[(io.BytesIO(content), name) for name, content in files])
+    return client.post('/start-batch', data=data, content_type='multipart/form-data')
+
+
+def test_batch_bigger_than_the_queue_takes_one_place(main, client, skip_ocr):
+    assert main.scheduler.max_queued < 20
+
+    response = post_batch(client, ('docs.zip', zip_bytes(20)), ('extra.pdf', pdf_bytes(2)))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['job_ids']) == 21
+    assert body['rejected'] == []
+    batch = client.get(f"/batch-status/{body['batch_id']}").get_json()
+    assert batch['pages_total'] == 22
+
+
+def test_full_queue_turns_the_batch_away_before_reading_it(main, client, monkeypatch):
+    monkeypatch.setattr(main.jobs, 'queue_entries', lambda: main.scheduler.max_queued)
+    before = set(os.listdir(main.UPLOAD_DIR))
+
+    response = post_batch(client, ('docs.zip', zip_bytes(3)))
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+    assert set(os.listdir(main.UPLOAD_DIR)) == before
+
+
+def test_batch_over_the_document_limit_is_rejected_before_unpacking(main, client, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_BATCH_FILES', 5)
+
+    def save_upload(stream, path):
+        raise AssertionError('unpacked a batch that was over the limit')
+    monkeypatch.setattr(main, 'save_upload', save_upload)
+
+    response = post_batch(client, ('docs.zip', zip_bytes(4)), ('a.pdf', pdf_bytes()), ('b.pdf', pdf_bytes()))
+    assert response.status_code == 400
+    assert 'limit is 5' in response.get_json()['error']
+
+
+def test_zip_with_too_many_members_is_rejected(main, client, monkeypatch):
+    monkeypatch.setattr(main, 'MAX_ZIP_MEMBERS', 3)
+
+    response = post_batch(client, ('docs.zip', zip_bytes(4)), ('a.pdf', pdf_bytes()))
+    assert response.status_code == 200
+    assert len(response.get_json()['job_ids']) == 1
+    assert response.get_json()['rejected'][0]['filename'] == 'docs.zip'
+
+
+def test_batch_from_chunked_uploads(main, client):
+    archive = zip_bytes(3)
+    upload_id = client.post('/uploads', json={'filename': 'docs.zip', 'size': len(archive)}).get_json()['upload_id']
+    assert client.put(f'/uploads/{upload_id}?offset=0', data=archive).status_code == 200
+
+    response = client.post('/start-batch', json={'upload_ids': [upload_id, 'f' * 32]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['job_ids']) == 3
+    assert body['rejected'] == [{'filename': 'f' * 32, 'error': 'Upload not found'}]
+    assert client.get(f'/uploads/{upload_id}').status_code == 404
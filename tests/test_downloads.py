@@ -0,0 +1,99 @@
+import itertools
+import os
+import time
+import uuid
+
+import pikepdf
+import pytest
+
+
+@pytest.fixture
+def make_job(main):
+    created = []
+
+    def make(**fields):
+        job = dict({'id': str(uuid.uuid4()), 'status': 'processing', 'progress': 30, 'filename': 'scan.pdf',
+                    'start_time': time.time()}, **fields)
+        main.jobs.create(job)
+        created.append(job['id'])
+        return job
+    yield make
+    for job_id in created:
+        main.jobs.delete(job_id)
+
+
+@pytest.fixture
+def completed_job(main, make_job, tmp_path):
+    path = os.path.join(main.OUTPUT_DIR, f'{uuid.uuid4()}.pdf')
+    pdf = pikepdf.Pdf.new()
+    for _ in range(3):
+        pdf.add_blank_page(page_size=(200, 200))
+    pdf.save(path)
+    yield make_job(status='completed', progress=100, output_file=path, output_size=os.path.getsize(path))
+    os.unlink(path)
+
+
+def test_job_status_etag_ignores_the_ticking_eta(main, client, make_job, monkeypatch):
+    etas = itertools.count(3)
+    monkeypatch.setattr(main.scheduler, 'eta', lambda job: next(etas))
+    job = make_job()
+
+    first = client.get(f"/job-status/{job['id']}")
+    assert first.get_json()['eta_seconds'] == 3
+    again = client.get(f"/job-status/{job['id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    main.update_job(job['id'], progress=60)
+    moved = client.get(f"/job-status/{job['id']}", headers={'If-None-Match': first.headers['ETag']})
+    assert moved.status_code == 200
+    assert moved.get_json()['progress'] == 60
+    assert moved.headers['ETag'] != first.headers['ETag']
+
+
+def test_batch_status_etag_ignores_elapsed_time(main, client, make_job):
+    job = make_job()
+    batch_id = uuid.uuid4().hex
+    main.save_batch({'id': batch_id, 'created': time.time(), 'job_ids': [job['id']], 'rejected': []})
+
+    first = client.get(f'/batch-status/{batch_id}')
+    time.sleep(0.2)
+    assert client.get(f'/batch-status/{batch_id}', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    main.update_job(job['id'], status='completed', progress=100)
+    assert client.get(f'/batch-status/{batch_id}', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_download_answers_ranges_and_etags(client, completed_job):
+    data = open(completed_job['output_file'], 'rb').read()
+    url = f"/download/{completed_job['id']}"
+
+    full = client.get(url)
+    assert full.status_code == 200
+    assert full.data == data
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    etag = full.headers['ETag']
+
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    tail = client.get(url, headers={'Range': 'bytes=100-', 'If-Range': etag})
+    assert tail.status_code == 206
+    assert tail.data == data[100:]
+    assert tail.headers['Content-Range'] == f'bytes 100-{len(data) - 1}/{len(data)}'
+
+    # The file changed since the client's copy: send all of it again
+    stale = client.get(url, headers={'Range': 'bytes=100-', 'If-Range': '"stale"'})
+    assert stale.status_code == 200
+    assert stale.data == data
+
+    assert client.get(url, headers={'Range': f'bytes={len(data) + 10}-'}).status_code == 416
+
+
+def test_download_is_offloaded_to_the_front_end_server(main, client, completed_job, monkeypatch):
+    monkeypatch.setattr(main, 'OCR_SENDFILE', 'x-accel')
+
+    response = client.get(f"/download/{completed_job['id']}")
+    assert response.status_code == 200
+    assert response.data == b''
+    relative = os.path.relpath(completed_job['output_file'], main.WORK_DIR)
+    assert response.headers['X-Accel-Redirect'].endswith('/' + relative)
+    assert 'X-Sendfile' not in response.headers
@@ -0,0 +1,72 @@
+import io
+import logging
+import shutil
+import sys
+
+import pytest
+from PIL import Image, ImageDraw
+
+
+def page_png():
+    image = Image.new('L', (600, 200), 255)
+    ImageDraw.Draw(image).text((20, 80), 'Hello OCR', fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', dpi=(300, 300))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fresh_engines(main, monkeypatch):
+    monkeypatch.setattr(main, '_engines', {})
+    yield main._engines
+    for engine in main._engines.values():
+        engine.close()
+
+
+def test_auto_falls_back_to_the_cli_and_says_so(main, monkeypatch, caplog):
+    monkeypatch.setattr(main, 'OCR_ENGINE', 'auto')
+    monkeypatch.setitem(sys.modules, 'tesserocr', None)  # not installed
+
+    assert main.engine_name() == 'subprocess'
+    with caplog.at_level(logging.INFO, logger='main'):
+        main.log_engine()
+    assert 'tesseract CLI per page' in caplog.text
+    assert 'install tesserocr' in caplog.text
+
+
+def test_engines_are_reused_then_recycled(main, monkeypatch, fresh_engines):
+    monkeypatch.setattr(main, 'OCR_ENGINE', 'subprocess')
+    monkeypatch.setattr(main, 'ENGINE_RECYCLE_PAGES', 3)
+
+    engine = main.get_engine('eng')
+    assert main.get_engine('eng') is engine
+    assert main.get_engine('deu') is not engine
+    engine.pages = 3
+    assert main.get_engine('eng') is not engine
+
+
+@pytest.mark.skipif(shutil.which('tesseract') is None, reason='tesseract is not installed')
+@pytest.mark.parametrize('scratch', [False, True])
+def test_cli_engine_returns_a_page_pdf(main, tmp_path, scratch):
+    engine = main.SubprocessEngine('eng')
+
+    pdf = engine.recognize(page_png(), str(tmp_path) if scratch else None)
+    assert pdf.startswith(b'%PDF')
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_warm_engine_returns_page_pdfs(main, monkeypatch, fresh_engines):
+    tesserocr = pytest.importorskip('tesserocr')
+    monkeypatch.setattr(main, 'OCR_ENGINE', 'auto')
+    monkeypatch.setattr(main, '_engine_version', None)
+    assert main.engine_name() == 'tesserocr'
+    assert main.engine_version() == 'tesserocr ' + tesserocr.tesseract_version().split('\n')[0]
+
+    engine = main.get_engine('eng')
+    assert isinstance(engine, main.TesserocrEngine)
+    # The same API instance serves page after page
+    for _ in range(2):
+        pdf = engine.recognize(page_png())
+        assert pdf.startswith(b'%PDF')
+    assert main.get_engine('eng') is engine
+    assert list(main.os.listdir(engine.scratch_dir)) == []
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(main, request, tmp_path):
+    if request.param == 'memory':
+        return main.MemoryJobStore()
+    return main.SQLiteJobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def make_job(job_id, **fields):
+    return dict({'id': job_id, 'start_time': time.time()}, **fields)
+
+
+def test_claims_by_priority_then_small_jobs_then_arrival(store):
+    # SMALL_JOB_PAGES is 10
+    store.enqueue(make_job('big-1', pages_total=500))
+    store.enqueue(make_job('small-8', pages_total=8))
+    store.enqueue(make_job('big-2', pages_total=300))
+    store.enqueue(make_job('small-2', pages_total=2))
+    store.enqueue(make_job('low-small', pages_total=1, priority='low'))
+    store.enqueue(make_job('high-big', pages_total=900, priority='high'))
+    store.enqueue(make_job('unknown-size'))
+
+    expected = ['high-big', 'small-2', 'small-8', 'big-1', 'big-2', 'unknown-size', 'low-small']
+    assert [store.queue_position(job_id) for job_id in expected] == list(range(1, len(expected) + 1))
+    assert [store.claim('worker')['id'] for _ in expected] == expected
+    assert store.claim('worker') is None
+    assert store.queue_position('big-1') is None
+
+
+def test_claim_with_max_pages_only_takes_small_jobs(store):
+    store.enqueue(make_job('big', pages_total=100))
+    store.enqueue(make_job('unknown'))
+    store.enqueue(make_job('small', pages_total=3))
+
+    assert store.claim('small-worker', max_pages=10)['id'] == 'small'
+    assert store.claim('small-worker', max_pages=10) is None
+    assert store.queue_depth() == 2
+
+
+def test_claimed_job_is_marked_processing(store):
+    store.enqueue(make_job('a'))
+    job = store.claim('worker-1')
+
+    assert job['status'] == 'processing'
+    assert job['worker'] == 'worker-1'
+    assert store.get('a')['status'] == 'processing'
+    assert store.queue_depth() == 0
+
+
+def test_each_job_is_claimed_exactly_once(store):
+    job_ids = [f'job-{i}' for i in range(200)]
+    for job_id in job_ids:
+        store.enqueue(make_job(job_id))
+
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        while True:
+            job = store.claim(worker_id)
+            if job is None:
+                return
+            with lock:
+                claimed.append(job['id'])
+
+    threads = [threading.Thread(target=worker, args=(f'worker-{i}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_deleted_job_is_not_claimed(store):
+    store.enqueue(make_job('a'))
+    store.enqueue(make_job('b'))
+    store.delete('a')
+
+    assert store.claim('worker')['id'] == 'b'
+    assert store.claim('worker') is None
+
+
+def test_a_batch_is_one_queue_entry(store):
+    for i in range(5):
+        store.enqueue(make_job(f'batch-{i}', batch_id='batch'))
+    store.enqueue(make_job('single'))
+
+    assert store.queue_depth() == 6
+    assert store.queue_entries() == 2
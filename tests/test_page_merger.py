@@ -0,0 +1,132 @@
+import io
+import os
+import random
+
+import pikepdf
+import pytest
+
+
+def page_pdf(width):
+    """A one-page PDF of the given width with its own copy of the same embedded font, like tesseract's output"""
+    pdf = pikepdf.Pdf.new()
+    font_file = pikepdf.Stream(pdf, b'glyphless font program ' * 200)
+    descriptor = pdf.make_indirect(pikepdf.Dictionary(Type=pikepdf.Name.FontDescriptor, FontFile2=font_file))
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.TrueType, BaseFont=pikepdf.Name.GlyphLessFont,
+        FontDescriptor=descriptor))
+    pdf.add_blank_page(page_size=(width, 200))
+    pdf.pages[0].obj.Resources = pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font))
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def input_pdf(tmp_path):
+    path = tmp_path / 'input.pdf'
+    pdf = pikepdf.Pdf.new()
+    for _ in range(20):
+        pdf.add_blank_page(page_size=(50, 50))
+    pdf.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('window', [100, 3])
+def test_pages_merge_in_order_with_one_shared_font(main, tmp_path, input_pdf, monkeypatch, window):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', window)
+    merger = main.PageMerger(input_pdf, chunk_dir=str(tmp_path / 'merged'))
+    page_nums = list(range(20))
+    random.Random(1).shuffle(page_nums)
+    for page_num in page_nums:
+        # Odd pages keep the original, even ones are OCR'd
+        merger.add(page_num, main.ORIGINAL_PAGE if page_num % 2 else page_pdf(100 + page_num))
+
+    output = tmp_path / 'output.pdf'
+    merger.save(str(output))
+
+    with pikepdf.open(output) as pdf:
+        widths = [round(float(page.mediabox[2])) for page in pdf.pages]
+        fonts = {page.Resources.Font.F1.objgen for page in pdf.pages if '/Font' in page.Resources}
+    assert widths == [50 if page_num % 2 else 100 + page_num for page_num in range(20)]
+    assert len(fonts) == 1
+    assert merger.resources_shared == 9
+    assert not (tmp_path / 'merged').exists()
+
+
+def test_failed_pages_are_left_out(main, tmp_path, input_pdf, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 2)
+    merger = main.PageMerger(input_pdf, chunk_dir=str(tmp_path / 'merged'))
+    for page_num in range(5):
+        merger.add(page_num, None if page_num == 2 else page_pdf(100 + page_num))
+    assert merger.pages_ready == 5
+    assert merger.pages_merged == 4
+
+    output = tmp_path / 'output.pdf'
+    merger.save(str(output))
+    with pikepdf.open(output) as pdf:
+        assert [round(float(page.mediabox[2])) for page in pdf.pages] == [100, 101, 103, 104]
+
+
+def test_owned_page_files_are_deleted_once_merged(main, tmp_path, input_pdf):
+    merger = main.PageMerger(input_pdf)
+    path = tmp_path / 'page.pdf'
+    path.write_bytes(page_pdf(100))
+    merger.add(1, str(path), owned=True)
+    assert path.exists()  # page 0 hasn't arrived yet
+    merger.add(0, main.ORIGINAL_PAGE)
+    assert not path.exists()
+    merger.close()
+
+
+def test_merger_carries_on_from_the_chunks_saved_before_a_crash(main, tmp_path, input_pdf, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 3)
+    chunk_dir = str(tmp_path / 'merged')
+    crashed = main.PageMerger(input_pdf, chunk_dir=chunk_dir)
+    for page_num in range(8):
+        crashed.add(page_num, None if page_num == 4 else page_pdf(100 + page_num))
+    # Two chunks of three merged pages, page 4 failed
+    assert crashed.pages_saved == 7
+    # Killed here, with page 7 only in memory
+    crashed.pdf.close()
+
+    merger = main.PageMerger(input_pdf, chunk_dir=chunk_dir)
+    assert merger.pages_ready == 7
+    assert merger.failed_pages == [4]
+    for page_num in range(7, 20):
+        merger.add(page_num, page_pdf(100 + page_num))
+    output = tmp_path / 'output.pdf'
+    merger.save(str(output))
+
+    with pikepdf.open(output) as pdf:
+        widths = [round(float(page.mediabox[2])) for page in pdf.pages]
+    assert widths == [100 + page_num for page_num in range(20) if page_num != 4]
+
+
+def test_chunks_are_dropped_once_joined(main, tmp_path, input_pdf, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 3)
+    merger = main.PageMerger(input_pdf, chunk_dir=str(tmp_path / 'merged'))
+    for page_num in range(20):
+        merger.add(page_num, page_pdf(100 + page_num))
+    merger.save_partial(str(tmp_path / 'partial.pdf'))
+    assert sorted(os.listdir(tmp_path / 'merged')) == [f'chunk_{i:05d}.pdf' for i in range(6)] + ['chunks.json']
+
+    files_at_save = []
+    concatenate = merger._concatenate
+
+    def watch(paths, output_file, options=()):
+        concatenate(paths, output_file, options)
+        files_at_save.append(sorted(os.listdir(tmp_path / 'merged')))
+    monkeypatch.setattr(merger, '_concatenate', watch)
+    share_resources = merger._share_resources
+
+    def watch_sharing(page):
+        if len(files_at_save) == 1:
+            files_at_save.append(sorted(os.listdir(tmp_path / 'merged')))
+        share_resources(page)
+    monkeypatch.setattr(merger, '_share_resources', watch_sharing)
+    merger.save(str(tmp_path / 'output.pdf'))
+
+    # Joining briefly needs the chunks and the joined copy; the chunks go before the final pass
+    assert 'joined.pdf' in files_at_save[0] and 'chunk_00000.pdf' in files_at_save[0]
+    assert files_at_save[1] == ['chunks.json', 'joined.pdf']
+    assert not (tmp_path / 'merged').exists()
@@ -0,0 +1,154 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+
+class GatedPool:
+    """Stands in for the page pool: runs tasks on threads once the test opens the gate"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def submit(self, fn, *args):
+        def run():
+            self.gate.wait(timeout=10)
+            return fn(*args)
+        return self.executor.submit(run)
+
+
+@pytest.fixture
+def pool(main, monkeypatch):
+    pool = GatedPool()
+    monkeypatch.setattr(main, 'get_page_pool', lambda: pool)
+    yield pool
+    pool.gate.set()
+    pool.executor.shutdown()
+
+
+def run_jobs(scheduler, pool, pages, memory=0):
+    """Queue every page of every job, then let them through; returns the order pages started in"""
+    order = []
+    lock = threading.Lock()
+
+    def task(job_id):
+        with lock:
+            order.append(job_id)
+        return job_id
+
+    futures = []
+    for job_id in pages:
+        scheduler.register(job_id, pages[job_id]['priority'], pages[job_id]['count'])
+    for job_id in pages:
+        futures += [scheduler.submit(job_id, memory, task, job_id) for _ in range(pages[job_id]['count'])]
+    pool.gate.set()
+    for future in futures:
+        assert future.result(timeout=10) in pages
+        scheduler.release(future)
+    return order
+
+
+def test_pages_are_shared_by_priority_weight(main, pool, monkeypatch):
+    monkeypatch.setattr(main, 'SMALL_JOB_PAGES', 0)
+    scheduler = main.PageScheduler(slots=1, memory_capacity=1)
+    order = run_jobs(scheduler, pool, {
+        'normal': {'priority': 'normal', 'count': 40},
+        'high': {'priority': 'high', 'count': 40},
+    })
+
+    # While both have pages left, high gets four for every one of normal (give or take
+    # the page dispatched before the other job's pages were queued)
+    first = order[:25]
+    assert 19 <= first.count('high') <= 21
+    assert sorted(order) == ['high'] * 40 + ['normal'] * 40
+
+
+def test_low_priority_still_progresses(main, pool, monkeypatch):
+    monkeypatch.setattr(main, 'SMALL_JOB_PAGES', 0)
+    scheduler = main.PageScheduler(slots=1, memory_capacity=1)
+    order = run_jobs(scheduler, pool, {
+        'normal': {'priority': 'normal', 'count': 20},
+        'low': {'priority': 'low', 'count': 20},
+    })
+
+    assert 1 <= order[:10].count('low') <= 3
+
+
+def test_small_jobs_go_first_fewest_pages_first(main, pool, monkeypatch):
+    monkeypatch.setattr(main, 'SMALL_JOB_PAGES', 5)
+    scheduler = main.PageScheduler(slots=1, memory_capacity=1)
+    order = run_jobs(scheduler, pool, {
+        'big': {'priority': 'high', 'count': 30},
+        'small-4': {'priority': 'normal', 'count': 4},
+        'small-2': {'priority': 'normal', 'count': 2},
+        'small-low': {'priority': 'low', 'count': 1},
+    })
+
+    # At most one big page is dispatched before the small jobs' pages are queued
+    assert order[:7].count('big') <= 1
+    assert [job_id for job_id in order[:7] if job_id != 'big'][:6] == ['small-2'] * 2 + ['small-4'] * 4
+    assert order.index('small-low') > order.index('small-4')
+
+
+def test_dispatch_stays_within_memory_budget(main, pool):
+    scheduler = main.PageScheduler(slots=8, memory_capacity=100)
+    peak = 0
+    lock = threading.Lock()
+
+    def task():
+        nonlocal peak
+        with lock:
+            peak = max(peak, scheduler.memory_reserved)
+        return True
+
+    scheduler.register('job', 'normal', 10)
+    futures = [scheduler.submit('job', 40, task) for _ in range(10)]
+    pool.gate.set()
+    for future in futures:
+        future.result(timeout=10)
+        scheduler.release(future)
+
+    assert peak <= 100
+    assert scheduler.memory_reserved == 0
+
+
+def test_page_bigger_than_budget_runs_alone(main, pool):
+    scheduler = main.PageScheduler(slots=2, memory_capacity=100)
+    scheduler.register('job', 'normal', 2)
+    futures = [scheduler.submit('job', 500, lambda: scheduler.memory_reserved) for _ in range(2)]
+    pool.gate.set()
+
+    reserved = [future.result(timeout=10) for future in futures[:1]]
+    assert reserved == [100]
+    scheduler.release(futures[0])
+    assert futures[1].result(timeout=10) == 100
+    scheduler.release(futures[1])
+    assert scheduler.memory_reserved == 0
+
+
+def test_unregister_cancels_queued_pages(main, pool):
+    scheduler = main.PageScheduler(slots=1, memory_capacity=1)
+    scheduler.register('job', 'normal', 5)
+    futures = [scheduler.submit('job', 0, lambda: True) for _ in range(5)]
+    scheduler.unregister('job')
+    pool.gate.set()
+
+    # The first page may have been dispatched before unregister; the rest never run
+    cancelled = [future.cancelled() for future in futures]
+    assert cancelled[1:] == [True] * 4
+    assert cancelled[0] or futures[0].result(timeout=10) is True
+    assert scheduler.backlog() == 0
+
+
+def test_pool_errors_reach_the_job(main, pool):
+    scheduler = main.PageScheduler(slots=1, memory_capacity=1)
+    scheduler.register('job', 'normal', 1)
+
+    def fail():
+        raise ValueError('page failed')
+
+    future = scheduler.submit('job', 0, fail)
+    pool.gate.set()
+    with pytest.raises(ValueError, match='page failed'):
+        future.result(timeout=10)
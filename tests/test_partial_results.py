@@ -0,0 +1,88 @@
+import os
+import time
+import uuid
+
+import pikepdf
+import pytest
+
+
+def blank_pdf(path, widths):
+    pdf = pikepdf.Pdf.new()
+    for width in widths:
+        pdf.add_blank_page(page_size=(width, 100))
+    pdf.save(path)
+
+
+@pytest.fixture
+def running_job(main):
+    job = {
+        'id': str(uuid.uuid4()),
+        'status': 'processing',
+        'progress': 40,
+        'filename': 'scan.pdf',
+        'pages_total': 5,
+        'pages_ready': 0,
+        'start_time': time.time()
+    }
+    main.jobs.create(job)
+    os.makedirs(os.path.join(main.job_dir(job['id']), 'pages'), exist_ok=True)
+    yield job
+    main.jobs.delete(job['id'])
+    main.remove_job_checkpoint(job['id'])
+
+
+def test_partial_output_has_the_leading_pages(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 2)
+    blank_pdf(tmp_path / 'input.pdf', [50] * 5)
+    merger = main.PageMerger(str(tmp_path / 'input.pdf'), chunk_dir=str(tmp_path / 'merged'))
+    for page_num in (0, 1, 2, 4):
+        blank_pdf(tmp_path / 'page.pdf', [100 + page_num])
+        merger.add(page_num, (tmp_path / 'page.pdf').read_bytes())
+    assert merger.pages_ready == 3
+
+    partial = tmp_path / 'partial.pdf'
+    merger.save_partial(str(partial))
+    with pikepdf.open(partial) as pdf:
+        assert [round(float(page.mediabox[2])) for page in pdf.pages] == [100, 101, 102]
+    merger.close()
+
+
+def test_partial_download_waits_for_the_first_pages(client, running_job):
+    response = client.get(f"/download/{running_job['id']}?partial=1")
+    assert response.status_code == 409
+    assert response.get_json()['pages_ready'] == 0
+    assert response.headers['Retry-After']
+
+
+def test_partial_download_waits_when_the_partial_file_is_missing(main, client, running_job):
+    main.update_job(running_job['id'], pages_ready=2)
+
+    response = client.get(f"/download/{running_job['id']}?partial=1")
+    assert response.status_code == 409
+
+
+def test_partial_download_serves_the_pages_ready_so_far(main, client, running_job):
+    blank_pdf(main.partial_output_path(running_job['id']), [100, 101])
+    main.update_job(running_job['id'], pages_ready=2)
+    data = open(main.partial_output_path(running_job['id']), 'rb').read()
+
+    response = client.get(f"/download/{running_job['id']}?partial=1")
+    assert response.status_code == 200
+    assert response.data == data
+    assert response.headers['X-Pages-Ready'] == '2'
+    assert response.headers['X-Pages-Total'] == '5'
+    assert 'scan_OCR_pages_1-2.pdf' in response.headers['Content-Disposition']
+
+    response = client.get(f"/download/{running_job['id']}?partial=1", headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert response.data == data[:10]
+
+
+def test_finished_page_is_served_from_its_checkpoint(main, client, running_job):
+    blank_pdf(main.checkpoint_page_path(running_job['id'], 2), [123])
+
+    response = client.get(f"/job-page/{running_job['id']}/3")
+    assert response.status_code == 200
+    assert response.data == open(main.checkpoint_page_path(running_job['id'], 2), 'rb').read()
+    assert client.get(f"/job-page/{running_job['id']}/4").status_code == 409
+    assert client.get(f"/job-page/{running_job['id']}/6").status_code == 404
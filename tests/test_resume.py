@@ -0,0 +1,114 @@
+import hashlib
+import shutil
+import time
+
+import pikepdf
+import pytest
+
+
+pytestmark = pytest.mark.skipif(shutil.which('tesseract') is None, reason='tesseract is not installed')
+
+
+def blank_pdf(path, widths):
+    pdf = pikepdf.Pdf.new()
+    for width in widths:
+        pdf.add_blank_page(page_size=(width, 300))
+    pdf.save(path)
+
+
+def checkpointed_job(main, tmp_path, pages):
+    """A job for a blank upload of that many pages, checkpointed as if it had been queued"""
+    blank_pdf(tmp_path / 'upload.pdf', [300] * pages)
+    upload = main.os.path.join(main.UPLOAD_DIR, f'{tmp_path.name}.pdf')
+    shutil.copy(tmp_path / 'upload.pdf', upload)
+    content_hash = hashlib.sha256((tmp_path / 'upload.pdf').read_bytes()).hexdigest()
+    job = main.create_job(upload, 'doc.pdf', content_hash, main.parse_job_options({'force_ocr': '1'}))
+    main.write_job_checkpoint(job)
+    return job
+
+
+def page_bytes(tmp_path, width):
+    blank_pdf(tmp_path / 'done.pdf', [width])
+    return (tmp_path / 'done.pdf').read_bytes()
+
+
+def wait_for(main, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = main.jobs.get(job_id)
+        if job is not None and job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_interrupted_job_resumes_from_its_page_checkpoints(main, tmp_path):
+    # A job that had finished two of its three pages when its process died:
+    # its checkpoint and page PDFs are on disk, but no store remembers it
+    job = checkpointed_job(main, tmp_path, 3)
+    for page_num, width in ((0, 111), (1, 112)):
+        main.write_page_checkpoint(job['id'], page_num, page_bytes(tmp_path, width))
+
+    main.recover_interrupted_jobs()
+    job = wait_for(main, job['id'])
+
+    assert job['status'] == 'completed', job.get('error')
+    assert job['pages_resumed'] == 2
+    with pikepdf.open(job['output_file']) as pdf:
+        # The first two pages come from the checkpoints, only the last was OCR'd again
+        assert [round(float(page.mediabox[2])) for page in pdf.pages] == [111, 112, 300]
+    assert not main.os.path.exists(main.job_dir(job['id']))
+
+
+def test_recovery_skips_jobs_whose_input_is_gone(main, tmp_path):
+    upload = main.os.path.join(main.UPLOAD_DIR, 'gone-test.pdf')
+    blank_pdf(upload, [300])
+    job = main.create_job(upload, 'gone.pdf', 'hash', main.parse_job_options({'force_ocr': '1'}))
+    main.write_job_checkpoint(job)
+    main.os.unlink(upload)
+
+    main.recover_interrupted_jobs()
+
+    assert main.jobs.get(job['id']) is None
+    assert not main.os.path.exists(main.job_dir(job['id']))
+
+
+def test_resume_takes_over_merged_chunks(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 2)
+    job = checkpointed_job(main, tmp_path, 4)
+
+    # The crashed run had merged pages 0 and 1 into a chunk and dropped their checkpoints,
+    # and had page 2 checkpointed
+    crashed = main.PageMerger(job['input_file'], chunk_dir=main.os.path.join(main.job_dir(job['id']), 'merged'))
+    for page_num, width in ((0, 111), (1, 112)):
+        crashed.add(page_num, page_bytes(tmp_path, width))
+    crashed.pdf.close()
+    main.write_page_checkpoint(job['id'], 2, page_bytes(tmp_path, 113))
+
+    main.recover_interrupted_jobs()
+    job = wait_for(main, job['id'])
+
+    assert job['status'] == 'completed', job.get('error')
+    assert job['pages_resumed'] == 3
+    with pikepdf.open(job['output_file']) as pdf:
+        assert [round(float(page.mediabox[2])) for page in pdf.pages] == [111, 112, 113, 300]
+
+
+def test_page_checkpoints_are_dropped_once_merged_into_a_chunk(main, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'MERGE_WINDOW_PAGES', 2)
+    removed = []
+    remove_file = main.remove_file
+
+    def watch(path):
+        removed.append(path)
+        return remove_file(path)
+    monkeypatch.setattr(main, 'remove_file', watch)
+
+    job = checkpointed_job(main, tmp_path, 5)
+    main.scheduler.submit(job)
+    job = wait_for(main, job['id'])
+
+    assert job['status'] == 'completed', job.get('error')
+    # Pages 0-3 went out in two chunks; page 4 was still in memory at save time
+    assert [path for path in removed if '/pages/' in path] == [
+        main.checkpoint_page_path(job['id'], page_num) for page_num in range(4)]
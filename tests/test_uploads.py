@@ -0,0 +1,119 @@
+import hashlib
+import io
+
+import pikepdf
+import pytest
+
+
+def pdf_bytes(pages=2):
+    pdf = pikepdf.Pdf.new()
+    for _ in range(pages):
+        pdf.add_blank_page(page_size=(200, 200))
+    buffer = io.BytesIO()
+    pdf.save(buffer)
+    return buffer.getvalue()
+
+
+def start_upload(client, data):
+    response = client.post('/uploads', json={'filename': 'doc.pdf', 'size': len(data)})
+    assert response.status_code == 200
+    return response.get_json()['upload_id']
+
+
+def put_chunk(client, upload_id, offset, chunk):
+    return client.put(f'/uploads/{upload_id}?offset={offset}', data=chunk)
+
+
+def upload_all(client, data, chunk_size=500):
+    upload_id = start_upload(client, data)
+    for offset in range(0, len(data), chunk_size):
+        assert put_chunk(client, upload_id, offset, data[offset:offset + chunk_size]).status_code == 200
+    return upload_id
+
+
+def test_chunks_append_at_the_committed_offset(client):
+    data = pdf_bytes()
+    upload_id = start_upload(client, data)
+
+    response = put_chunk(client, upload_id, 0, data[:300])
+    assert response.get_json()['offset'] == 300
+
+    # A retried chunk, or one from the future, is refused with the offset to continue from
+    for offset in (0, 600):
+        response = put_chunk(client, upload_id, offset, data[offset:offset + 300])
+        assert response.status_code == 409
+        assert response.get_json()['offset'] == 300
+    assert client.get(f'/uploads/{upload_id}').get_json()['offset'] == 300
+
+    assert put_chunk(client, upload_id, 300, data[300:]).get_json()['offset'] == len(data)
+
+
+def test_finalize_queues_the_whole_file(main, client):
+    data = pdf_bytes()
+    upload_id = upload_all(client, data)
+
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 200
+    job = main.jobs.get(response.get_json()['job_id'])
+    assert job['content_hash'] == hashlib.sha256(data).hexdigest()
+    assert client.get(f'/uploads/{upload_id}').status_code == 404
+
+
+def test_finalize_hashes_the_file_when_chunks_landed_on_another_process(main, client):
+    data = pdf_bytes()
+    upload_id = upload_all(client, data)
+    # What another worker process sees: the session on disk, without our hash state
+    main.uploads.clear()
+
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    job = main.jobs.get(response.get_json()['job_id'])
+    assert job['content_hash'] == hashlib.sha256(data).hexdigest()
+
+
+def test_finalize_refuses_an_incomplete_upload(client):
+    data = pdf_bytes()
+    upload_id = start_upload(client, data)
+    put_chunk(client, upload_id, 0, data[:100])
+
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100
+
+
+def test_upload_that_is_not_a_document_is_rejected_on_its_first_chunk(client):
+    upload_id = start_upload(client, b'x' * 1000)
+
+    response = put_chunk(client, upload_id, 0, b'x' * 1000)
+    assert response.status_code == 400
+    assert client.get(f'/uploads/{upload_id}').status_code == 404
+
+
+def test_upload_larger_than_declared_is_rejected(client):
+    data = pdf_bytes()
+    upload_id = start_upload(client, data)
+
+    assert put_chunk(client, upload_id, 0, data + b'extra').status_code == 400
+
+
+@pytest.mark.parametrize('full_at', ['admission', 'submit'])
+def test_finalize_keeps_the_upload_when_the_queue_is_full(main, client, monkeypatch, full_at):
+    data = pdf_bytes()
+    upload_id = upload_all(client, data)
+
+    with monkeypatch.context() as patch:
+        if full_at == 'admission':
+            patch.setattr(main.jobs, 'queue_entries', lambda: main.scheduler.max_queued)
+        else:
+            # Another upload took the last slot between the check and the submit
+            def submit(job):
+                raise main.QueueFullError(5)
+            patch.setattr(main.scheduler, 'submit', submit)
+        response = client.post(f'/uploads/{upload_id}/finalize')
+        assert response.status_code == 503
+        assert response.headers['Retry-After']
+
+    assert client.get(f'/uploads/{upload_id}').get_json()['offset'] == len(data)
+    response = client.post(f'/uploads/{upload_id}/finalize')
+    assert response.status_code == 200
+    job = main.jobs.get(response.get_json()['job_id'])
+    assert job['content_hash'] == hashlib.sha256(data).hexdigest()